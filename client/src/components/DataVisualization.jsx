@@ -1,13 +1,12 @@
 //eslint-disable-next-line
 import { motion } from "framer-motion";
 import ChartRenderer from "./ChartRenderer"; // Make sure this points to the correct chart renderer file
+import { toRecords } from "../utils/dataHelpers";
 
 const DataVisualization = ({ visualizationData }) => {
-  if (
-    !visualizationData ||
-    !visualizationData.data ||
-    visualizationData.data.length === 0
-  ) {
+  const data = toRecords(visualizationData?.data);
+
+  if (data.length === 0) {
     return (
       <div className="text-red-500 text-center p-4">
         Data is incompatible for chart visualization
@@ -15,7 +14,7 @@ const DataVisualization = ({ visualizationData }) => {
     );
   }
 
-  const { data, recommended_graphs } = visualizationData;
+  const { recommended_graphs } = visualizationData;
 
   return (
     <motion.div
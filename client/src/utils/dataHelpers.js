@@ -11,3 +11,14 @@ export const getCategoricalFields = (data) => {
   const sample = data[0];
   return Object.keys(sample).filter((key) => typeof sample[key] === "string");
 };
+
+// Accepts either row objects or the columnar {columns, data} result format
+export const toRecords = (result) => {
+  if (Array.isArray(result)) return result;
+  if (!result || !Array.isArray(result.columns) || !Array.isArray(result.data))
+    return [];
+  const { columns, data } = result;
+  return data.map((values) =>
+    Object.fromEntries(columns.map((column, i) => [column, values[i]]))
+  );
+};
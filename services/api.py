@@ -1,30 +1,43 @@
-from fastapi import FastAPI, HTTPException, UploadFile, Form, Response
+from fastapi import FastAPI, HTTPException, UploadFile, Form, Request, Response, Header, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-from utils.db import configure_db, get_database_schema
+from utils.db import configure_db, connection_key, dispose_engines, get_cached_fingerprint, get_pooled_engine, refresh_database_schema, schema_identity
 from utils.chat import chat_db
-from groq import Groq
-from googletrans import Translator
+from utils.executor import run_blocking, run_on_resource, shutdown_executor, single_flight
+from utils.cache import MemoryCache
+from utils.completions import complete, completion_indexes
+from utils.guard import cancel_scope
+from utils.jobs import job_queue
+from utils.graphs import profile_result, profile_signature, recommend_from_profile
+from utils.llm import close_clients, complete as llm_complete, groq_client
+from utils.metrics import collect_timings, render_metrics, stage
+from utils.query_cache import query_cache
+from utils.recommend import build_recommendations, cached_recommendations
+from utils.schema_index import prune_schema
+from utils.tts import AUDIO_FORMATS, TTS_CONCURRENCY, SpeechCache, speech_cache, synthesize
+from utils.translation import translate_text, translate_texts
+from utils.speech import FORM_OVERHEAD_BYTES, STT_CONCURRENCY, check_upload_size, transcribe
+from utils.results import ResultJSONResponse, dumps
+import asyncio
+import hmac
 import os
 from dotenv import load_dotenv
-from pathlib import Path
-import uuid
-from fastapi.responses import FileResponse
-from typing import Optional, List, Dict, Any
+from fastapi.responses import FileResponse, StreamingResponse
+from typing import Optional, List, Dict, Any, Literal
 import json
 import re
 import traceback
-import requests
+import httpx
+from twilio.rest import Client as TwilioClient
 from twilio.twiml.messaging_response import MessagingResponse
 
 load_dotenv()
 
 
-groq_api_key_2 = os.getenv("GROQ_API_KEY_2")
+admin_token = os.getenv("ADMIN_TOKEN")
 
 
 api = FastAPI()
-client = Groq(api_key=groq_api_key_2)
 
 # Add CORS middleware
 api.add_middleware(
@@ -34,7 +47,21 @@ api.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-client = Groq(api_key=groq_api_key_2)
+
+COMPLETION_RESULT_TTL = int(os.getenv("COMPLETION_RESULT_TTL", "30"))
+recent_completions = MemoryCache("completions", max_entries=4096, ttl=COMPLETION_RESULT_TTL)
+graph_recommendations = MemoryCache("graphs", max_entries=2048)
+GRAPH_LLM_CONCURRENCY = int(os.getenv("GRAPH_LLM_CONCURRENCY", "8"))
+# Keeps running syntheses referenced until they finish
+speech_tasks = set()
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "1"))
+
+
+@api.on_event("shutdown")
+def close_db_pools():
+    shutdown_executor()
+    dispose_engines()
+    close_clients()
 
 class DatabaseConfig(BaseModel):
     dbtype: str
@@ -45,28 +72,50 @@ class DatabaseConfig(BaseModel):
     
 class QueryRequest(BaseModel):
     query: str
+    include_summary: bool = True
+    include_title: bool = True
+    result_format: Literal["rows", "columnar"] = "rows"
+    generation_mode: Literal["agent", "fast"] = "agent"
+    include_timings: bool = False
 
 class SearchCompletionsRequest(BaseModel):
     term: str = Field(..., description="The partial search term to find completions for")
     limit: int = Field(10, description="Maximum number of completions to return")
     database_config: Optional[DatabaseConfig] = None
+    enrich: bool = Field(False, description="Ask the LLM for extra suggestions in the background; they are served from the next keystroke on")
 
 class GraphRecommendationRequest(BaseModel):
     sql_result_json: List[Dict[str, Any]] = Field(..., description="The result of the SQL query in JSON format (list of dictionaries)")
 
+class ChatJobRequest(BaseModel):
+    database_config: DatabaseConfig
+    query_request: QueryRequest
+    lane: Literal["interactive", "report"] = "report"
+    callback_url: Optional[str] = Field(None, description="POSTed the finished job (including metadata) once it succeeds, fails or is cancelled; must be under JOB_CALLBACK_ALLOWED_URLS")
+    metadata: Optional[Dict[str, Any]] = None
+
+class TranslateBatchRequest(BaseModel):
+    texts: List[str] = Field(..., max_length=500, description="Strings to translate, answered in the same order")
+    src: str = "auto"
+    dest: str = "en"
+
 async def translate_to_english(text: str) -> str:
-    translator = Translator()
-    translated = await translator.translate(text, dest='en')
-    return translated.text
+    translated = await translate_text(text, dest="en")
+    return translated["text"]
 
 @api.get("/")  
 def read_root():   
     return {"Hello": "World"}
 
 
-@api.post("/chat")
-async def chat_with_db(request_data: dict):
-    
+@api.get("/metrics")
+def metrics(x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+def parse_chat_request(request_data: dict):
     if "database_config" not in request_data or "query_request" not in request_data:
         raise HTTPException(status_code=400, detail="Request must include database_config and query_request")
     
@@ -78,19 +127,59 @@ async def chat_with_db(request_data: dict):
         query_request = QueryRequest(**query_request_data)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid request format: {str(e)}")
-    
+
+    return db_config, query_request
+
+
+async def cancel_on_disconnect(request: Request, scope):
+    while not scope.cancelled:
+        if await request.is_disconnected():
+            scope.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+async def run_chat(db_config: DatabaseConfig, query_request: QueryRequest, on_event=None, request: Optional[Request] = None):
+    """Run chat_db on the worker pool; the running query is cancelled if this task is cancelled or the client goes away."""
+    tenant = connection_key(
+        db_config.dbtype, db_config.host, db_config.user,
+        db_config.password, db_config.dbname
+    )
+
+    with collect_timings() as timings, stage("chat"), cancel_scope() as scope:
+        watcher = asyncio.create_task(cancel_on_disconnect(request, scope)) if request is not None else None
+        try:
+            result = await run_blocking(
+                tenant, chat_db,
+                db_config.dbtype, db_config.host, db_config.user, 
+                db_config.password, db_config.dbname, query_request.query,
+                include_summary=query_request.include_summary,
+                include_title=query_request.include_title,
+                on_event=on_event,
+                result_format=query_request.result_format,
+                generation_mode=query_request.generation_mode
+            )
+        except asyncio.CancelledError:
+            scope.cancel()
+            raise
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+    if query_request.include_timings and isinstance(result, dict):
+        result["timings"] = timings
+    return result
+
+
+@api.post("/chat")
+async def chat_with_db(request_data: dict, request: Request):
+    db_config, query_request = parse_chat_request(request_data)
+
     try:
-        db, engine = configure_db(
-            db_config.dbtype, db_config.host, db_config.user, 
-            db_config.password, db_config.dbname
-        )
-    
-        result = chat_db(
-            db_config.dbtype, db_config.host, db_config.user, 
-            db_config.password, db_config.dbname, query_request.query
-        )
+        result = await run_chat(db_config, query_request, request=request)
         
-        return result
+        with stage("serialize"):
+            return ResultJSONResponse(content=result)
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -100,8 +189,131 @@ async def chat_with_db(request_data: dict):
             "details": str(e)
         }
 
+
+@api.post("/chat/stream")
+async def chat_with_db_stream(request_data: dict):
+    """
+    Same pipeline as /chat, streamed as newline-delimited JSON events:
+    thought/observation steps, sql, columns, rows batches, summary_token, summary, title,
+    then a final done (or error) event.
+    """
+    db_config, query_request = parse_chat_request(request_data)
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def on_event(event, payload):
+        # Called from the worker thread running chat_db
+        loop.call_soon_threadsafe(events.put_nowait, {"event": event, **payload})
+
+    async def produce():
+        try:
+            result = await run_chat(db_config, query_request, on_event=on_event)
+            done = {key: value for key, value in result.items() if key != "sql_result"}
+            await events.put({"event": "done", **done})
+        except HTTPException as e:
+            await events.put({"event": "error", "detail": e.detail})
+        except Exception as e:
+            await events.put({"event": "error", "detail": str(e)})
+        finally:
+            await events.put(None)
+
+    async def stream():
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield dumps(event) + b"\n"
+        finally:
+            producer.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+async def run_chat_job(payload, on_event):
+    db_config, query_request = payload
+    return await run_chat(db_config, query_request, on_event=on_event)
+
+job_queue.register("chat", run_chat_job)
+
+
+@api.post("/chat/jobs", status_code=202)
+async def create_chat_job(job_request: ChatJobRequest):
+    """Queue a question and return at once; poll GET /chat/jobs/{job_id} for partial and final results."""
+    db_config = job_request.database_config
+    tenant = connection_key(db_config.dbtype, db_config.host, db_config.user, db_config.password, db_config.dbname)
+    job = job_queue.submit(
+        "chat", (db_config, job_request.query_request), tenant,
+        lane=job_request.lane, callback_url=job_request.callback_url, metadata=job_request.metadata
+    )
+    return {"job_id": job["id"], "status": job["status"], "lane": job["lane"]}
+
+
+@api.get("/chat/jobs/{job_id}")
+async def get_chat_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return ResultJSONResponse(content=job)
+
+
+@api.post("/chat/jobs/{job_id}/cancel")
+async def cancel_chat_job(job_id: str):
+    job = job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job_id, "status": job["status"] if job["status"] != "running" else "cancelling"}
+
+
+def llm_recommendations(engine):
+    # No question to rank against yet, so this keeps the best connected tables on very large schemas
+    schema = prune_schema(engine, "")
+    
+    prompt = f"""
+    Given the following database schema:
+    {schema}
+    
+    Generate 10 natural language queries that a business user might ask about this database.
+    Each query should be a single sentence and should be relevant to the schema provided.
+    Avoid complex queries or technical jargon. The query should be simple and understandable.
+    the query should be start with select when coverted to sql query.
+    Return them as a JSON array of strings. Each query should be clear and answerable using SQL.
+    """
+    
+    llm_response = llm_complete(
+        "recommend",
+        messages=[
+            {"role": "system", "content": "You are a database expert that helps generate natural language queries."},
+            {"role": "user", "content": prompt}
+        ],
+        temperature=0.7,
+        max_tokens=1024
+    )
+    try:
+        return json.loads(llm_response)
+    except json.JSONDecodeError:
+        json_match = re.search(r'\[.*\]', llm_response, re.DOTALL)
+        if json_match:
+            return json.loads(json_match.group(0))
+        return [q.strip().strip('"').strip("'") for q in llm_response.split('\n') if q.strip()]
+
+
+async def rebuild_recommendations(tenant, engine):
+    # Concurrent requests for the same database share one generation
+    return await single_flight(
+        ("recommend", schema_identity(engine)),
+        lambda: run_blocking(tenant, build_recommendations, engine, llm_recommendations),
+    )
+
+
 @api.post("/recommend")
-async def recommend_queries(request_data: dict):
+async def recommend_queries(request_data: dict, background_tasks: BackgroundTasks, refresh: bool = False):
+    """Suggested questions, cached per database and schema version.
+
+    A schema change serves the previous suggestions while new ones are generated in the background;
+    refresh=true regenerates them before answering.
+    """
     if "database_config" not in request_data:
         raise HTTPException(status_code=400, detail="Request must include database_config")
     
@@ -111,81 +323,77 @@ async def recommend_queries(request_data: dict):
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid request format: {str(e)}")
     
+    refresh = refresh or bool(request_data.get("refresh", False))
+    tenant = connection_key(db_config.dbtype, db_config.host, db_config.user, db_config.password, db_config.dbname)
     try:
-        _, engine = configure_db(db_config.dbtype, db_config.host, db_config.user, db_config.password, db_config.dbname)
-        
-        schema = get_database_schema(engine)
-        
-        prompt = f"""
-        Given the following database schema:
-        {schema}
-        
-        Generate 10 natural language queries that a business user might ask about this database.
-        Each query should be a single sentence and should be relevant to the schema provided.
-        Avoid complex queries or technical jargon. The query should be simple and understandable.
-        the query should be start with select when coverted to sql query.
-        Return them as a JSON array of strings. Each query should be clear and answerable using SQL.
-        """
-        
-        response = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "You are a database expert that helps generate natural language queries."},
-                {"role": "user", "content": prompt}
-            ],
-            model="llama-3.1-8b-instant", 
-            temperature=0.7,
-            max_tokens=1024
-        )
-        
-        llm_response = response.choices[0].message.content
-        import json
-        try:
+        _, engine = await run_blocking(tenant, configure_db, db_config.dbtype, db_config.host, db_config.user, db_config.password, db_config.dbname)
+        recommended_queries, fresh = await run_blocking(tenant, cached_recommendations, engine)
 
-            recommended_queries = json.loads(llm_response)
-        except json.JSONDecodeError:
-        
-            import re
-            json_match = re.search(r'\[.*\]', llm_response, re.DOTALL)
-            if json_match:
-                recommended_queries = json.loads(json_match.group(0))
-            else:
-            
-                recommended_queries = [q.strip().strip('"').strip("'") for q in llm_response.split('\n') if q.strip()]
+        if recommended_queries is None or refresh:
+            recommended_queries = await rebuild_recommendations(tenant, engine)
+        elif not fresh:
+            background_tasks.add_task(rebuild_recommendations, tenant, engine)
         
         return {
             "recommended_queries": recommended_queries
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
         error_details = traceback.format_exc()
         raise HTTPException(status_code=500, detail=f"Error processing recommendation: {str(e)}\n{error_details}")
 
 
-@api.post("/speech-to-text")
-async def speech_to_text(file: UploadFile,language: str = Form("en")):
+def check_admin_token(x_admin_token: Optional[str]):
+    # Without a configured token the admin endpoints stay closed
+    if not admin_token or not hmac.compare_digest((x_admin_token or "").encode("utf-8"), admin_token.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@api.post("/admin/schema/refresh")
+async def refresh_schema(db_config: DatabaseConfig, x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+
+    tenant = connection_key(db_config.dbtype, db_config.host, db_config.user, db_config.password, db_config.dbname)
+    _, engine = await run_blocking(tenant, configure_db, db_config.dbtype, db_config.host, db_config.user, db_config.password, db_config.dbname)
     try:
-        temp_filename = f"temp_{file.filename}"
-        with open(temp_filename, "wb") as temp_file:
-            temp_file.write(await file.read())
-
-        with open(temp_filename, "rb") as audio_file:
-            transcription = client.audio.transcriptions.create(
-                file=(temp_filename, audio_file.read()),
-                model="whisper-large-v3",
-                response_format="verbose_json",
-                language=language
-            )
+        tables = await run_blocking(tenant, refresh_database_schema, engine)
+        fingerprint = await run_blocking(tenant, get_cached_fingerprint, engine)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error refreshing schema: {str(e)}")
+
+    return {
+        "tables": len(tables),
+        "fingerprint": fingerprint
+    }
 
-        os.remove(temp_filename)
+
+@api.get("/admin/cache/stats")
+async def cache_stats(x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+
+    return {"nl2sql": query_cache.stats(), "tts": speech_cache.stats(), "jobs": job_queue.stats()}
+
+
+@api.post("/speech-to-text")
+async def speech_to_text(file: UploadFile, language: str = Form("en"), content_length: Optional[int] = Header(None)):
+    # The multipart body is already spooled by the server; the upload is handed on without copying it to disk
+    check_upload_size(content_length, slack=FORM_OVERHEAD_BYTES)
+    try:
+        transcription = await run_on_resource("stt", STT_CONCURRENCY, transcribe, groq_client(), file.file, file.filename, language)
 
         return {
-            "transcription": transcription.text,
-            "detected_language": transcription.language if hasattr(transcription, "language") else language
+            "transcription": transcription["text"],
+            "detected_language": transcription["language"] or language
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing audio file: {str(e)}")
+    finally:
+        await file.close()
 
 @api.post("/translate")
 async def translate(text: str):
@@ -194,67 +402,78 @@ async def translate(text: str):
         return {"original_text": text, "translated_text": translated_text}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error translating text: {str(e)}")
+
+
+@api.post("/translate/batch")
+async def translate_batch(request: TranslateBatchRequest):
+    try:
+        translations = await translate_texts(request.texts, src=request.src, dest=request.dest)
+        return {
+            "translations": [
+                {"original_text": text, "translated_text": translation["text"], "source_language": translation["src"]}
+                for text, translation in zip(request.texts, translations)
+            ]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error translating text: {str(e)}")
     
 @api.post("/text-to-speech")
-async def text_to_speech(text: str, voice: str = Form("Aaliyah-PlayAI")):
-    try:
-        unique_id = str(uuid.uuid4())
-        output_dir = Path("speech_output")
-        output_dir.mkdir(exist_ok=True) 
-        
-        speech_file_path = output_dir / f"{unique_id}.wav"
-     
-        response = client.audio.speech.create(
-            model="playai-tts",  
-            voice=voice,        
-            response_format="wav", 
-            input=text         
-        )
-        
-   
-        try:
-            with open(speech_file_path, "wb") as f:
-                response.write_to_file(speech_file_path)
+async def text_to_speech(text: str, voice: str = Form("Aaliyah-PlayAI"), audio_format: str = Form("wav")):
+    """Speech for the text, streamed as the backend produces it; repeated (text, voice, format) requests are served from disk."""
+    if audio_format not in AUDIO_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported audio_format: {audio_format}. Choose one of {', '.join(AUDIO_FORMATS)}.")
 
-        except AttributeError:
-            try:
-                response.stream_to_file(speech_file_path)
-            except AttributeError as e:
-                raise AttributeError(f"Groq response object does not have expected methods ('write_to_file' or 'stream_to_file'). Error: {e}")
+    key = SpeechCache.key(text, voice, audio_format)
+    filename = f"speech_{key[:16]}.{audio_format}"
+    cached = speech_cache.get(key, audio_format)
+    if cached is not None:
+        return FileResponse(path=cached, media_type=AUDIO_FORMATS[audio_format], filename=filename)
 
-        finally:
-            if speech_file_path.exists():
-                os.remove(speech_file_path)
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
 
-        return FileResponse(
-            path=speech_file_path,
-            media_type="audio/wav",
-            filename=f"speech_{unique_id}.wav" 
-        )
-        
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error generating speech: {str(e)}\n{error_details}") 
-        raise HTTPException(status_code=500, detail=f"Error generating speech: {str(e)}")
-    
-    
-@api.post("/search-completions")
-async def search_completions(request: SearchCompletionsRequest):
-    term, limit, config = request.term, request.limit, request.database_config
-    completions, schema = [], None
+    def on_chunk(chunk):
+        # Called from the worker thread talking to the backend
+        loop.call_soon_threadsafe(chunks.put_nowait, chunk)
 
-    
-    if config:
+    async def produce():
         try:
-            _, engine = configure_db(
-                config.dbtype, config.host, config.user, config.password, config.dbname
-            )
-            schema = get_database_schema(engine)
+            await run_on_resource("tts", TTS_CONCURRENCY, synthesize, groq_client(), text, voice, audio_format, on_chunk)
         except Exception as e:
-            print(f"[Warning] Failed to load DB schema: {e}")
-
+            print(f"Error generating speech: {str(e)}\n{traceback.format_exc()}")
+            await chunks.put(e)
+        finally:
+            await chunks.put(None)
+
+    # The synthesis finishes (and lands in the cache) even if the client goes away mid-stream
+    task = asyncio.create_task(produce())
+    speech_tasks.add(task)
+    task.add_done_callback(speech_tasks.discard)
+
+    # Wait for the first chunk so backend errors still become a proper error response
+    first = await chunks.get()
+    if isinstance(first, Exception):
+        raise HTTPException(status_code=500, detail=f"Error generating speech: {str(first)}")
+
+    async def stream():
+        chunk = first
+        while chunk is not None:
+            if isinstance(chunk, Exception):
+                # Headers are already sent; ending early is all that is left
+                return
+            yield chunk
+            chunk = await chunks.get()
+
+    return StreamingResponse(
+        stream(),
+        media_type=AUDIO_FORMATS[audio_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
     
+    
+def llm_completions(term: str, limit: int, schema: Optional[dict]) -> List[str]:
     if schema:
         prompt = (
             f"Given the following database schema:\n{schema}\n\n"
@@ -271,56 +490,102 @@ async def search_completions(request: SearchCompletionsRequest):
             f"Output as a JSON list of strings."
         )
 
-    
+    content = llm_complete(
+        "search_completions",
+        temperature=0.2,
+        max_tokens=256,
+        response_format={"type": "json_object"},
+        messages=[
+            {"role": "system", "content": "You are an assistant providing database query autocompletions."},
+            {"role": "user", "content": prompt}
+        ]
+    )
+
     try:
-        response = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            temperature=0.2,
-            max_tokens=256,
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": "You are an assistant providing database query autocompletions."},
-                {"role": "user", "content": prompt}
-            ]
-        )
+        parsed = json.loads(content)
+        completions = parsed.get("suggestions") if isinstance(parsed, dict) else parsed
+    except json.JSONDecodeError:
+        print(f"[Warning] Invalid JSON from LLM: {content}")
+        completions = re.findall(r'"(.*?)"', content) or []
 
-        content = response.choices[0].message.content
+    return [str(completion) for completion in completions or []][:limit]
 
-        try:
-            parsed = json.loads(content)
-            completions = parsed.get("suggestions") if isinstance(parsed, dict) else parsed
-        except json.JSONDecodeError:
-            print(f"[Warning] Invalid JSON from LLM: {content}")
-            completions = re.findall(r'"(.*?)"', content) or []
 
-    except Exception as e:
-        print(f"[Error] LLM failure for term '{term}': {e}\n{traceback.format_exc()}")
-        completions = [f"Error generating suggestions for '{term}'"]
+async def completion_engine(config: DatabaseConfig):
+    pooled = get_pooled_engine(config.dbtype, config.host, config.user, config.password, config.dbname)
+    if pooled is not None:
+        return pooled[1]
 
-    return {"completions": completions[:limit]}
+    key = connection_key(config.dbtype, config.host, config.user, config.password, config.dbname)
+    _, engine = await single_flight(
+        ("configure_db", key),
+        lambda: run_blocking(("typeahead", key), configure_db, config.dbtype, config.host, config.user, config.password, config.dbname)
+    )
+    return engine
 
 
+async def completion_index(engine, background_tasks: BackgroundTasks):
+    identity = schema_identity(engine)
+    index, needs_refresh = completion_indexes.get(engine)
+    if index is None:
+        # Column values are sampled when the schema loads and join the live index once ready
+        index = await single_flight(
+            ("completion_index", identity),
+            lambda: run_blocking(("typeahead", identity), completion_indexes.build, engine)
+        )
+    elif needs_refresh:
+        background_tasks.add_task(single_flight, ("completion_index", identity), lambda: run_blocking(("typeahead", identity), completion_indexes.build, engine))
+    return index
 
-@api.post("/graphrecommender")
-async def recommend_graph(request: GraphRecommendationRequest) -> Dict[str, List[str]]:
-    data = request.sql_result_json
 
-    
-    if not data or not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
-        raise HTTPException(status_code=400, detail="Invalid input: Expected a list of dictionaries.")
-
-    
+async def enrich_completions(engine, term: str, limit: int):
+    identity = schema_identity(engine)
     try:
-        data_preview = json.dumps(data[:5], indent=2)
-        total_json_size = len(json.dumps(data))
-        if total_json_size > 1500 and len(data_preview) > 1000:
-            data_preview = data_preview[:1000] + "\n... (data truncated)"
-        elif len(data) > 5:
-            data_preview += "\n... (more rows exist)"
+        schema = await run_blocking(("typeahead", identity), prune_schema, engine, term)
+        suggestions = await single_flight(
+            ("completion_llm", identity, term.strip().lower()),
+            lambda: run_blocking(("typeahead", identity), llm_completions, term, limit, schema)
+        )
+        completion_indexes.add_suggestions(engine, suggestions)
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to process input data preview: {e}")
+        print(f"[Error] LLM enrichment failed for term '{term}': {e}\n{traceback.format_exc()}")
+
+
+@api.post("/search-completions")
+async def search_completions(request: SearchCompletionsRequest, background_tasks: BackgroundTasks):
+    term, limit, config = request.term, request.limit, request.database_config
+    engine, index = None, None
+
+    if config:
+        try:
+            engine = await completion_engine(config)
+            index = await completion_index(engine, background_tasks)
+        except Exception as e:
+            print(f"[Warning] Failed to load DB schema: {e}")
+
+    # Repeated keystrokes for the same prefix are served from a short-lived result cache
+    cache_key = (schema_identity(engine) if engine is not None else None, term.strip().lower(), limit)
+    completions = recent_completions.get(cache_key)
+    if completions is None:
+        with stage("search_completions_local"):
+            completions = complete(index, term, limit)
+        recent_completions.set(cache_key, completions)
+
+    if request.enrich and engine is not None and len(completions) < limit:
+        background_tasks.add_task(enrich_completions, engine, term, limit)
+
+    return {"completions": completions[:limit]}
+
+
+
+def llm_graph_recommendation(data: List[Dict[str, Any]]) -> List[str]:
+    # Only the first rows are shown to the LLM, so only they are serialized
+    data_preview = json.dumps(data[:5], indent=2, default=str)
+    if len(data_preview) > 1000:
+        data_preview = data_preview[:1000] + "\n... (data truncated)"
+    elif len(data) > 5:
+        data_preview += "\n... (more rows exist)"
 
-    
     column_names = list(data[0].keys()) if data else []
     prompt = (
         f"Data Preview:\n"
@@ -333,61 +598,70 @@ async def recommend_graph(request: GraphRecommendationRequest) -> Dict[str, List
         f"Respond ONLY with the Primary and Alternative recommendations in the specified format." 
     )
 
-    try:
-        
-        response = client.chat.completions.create(
-            model="llama-3.1-8b-instant", 
-            temperature=0.2, 
-            max_tokens=100, 
-            
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert data visualization assistant. Recommend graph types based on provided data, following the specific output format."
-                },
-                {"role": "user", "content": prompt}
-            ]
-        )
-
-        content = response.choices[0].message.content
-        
-        
-        
-        
-
-        recommended_graphs: List[str] = [] 
+    content = llm_complete(
+        "graph_recommend",
+        temperature=0.2,
+        max_tokens=100,
+        messages=[
+            {
+                "role": "system",
+                "content": "You are an expert data visualization assistant. Recommend graph types based on provided data, following the specific output format."
+            },
+            {"role": "user", "content": prompt}
+        ]
+    )
 
-        
-        primary_match = re.search(r"Primary:\s*\[?\"?(\w+)\"?\]?", content)
-        alternative_match = re.search(r"Alternative:\s*\[?\"?([\w,\s\"]+)\"?\]?", content)
+    recommended_graphs: List[str] = [] 
 
-        if primary_match:
-            primary_graph = primary_match.group(1)
-            recommended_graphs.append(primary_graph)
-            if alternative_match:
-                alternatives_str = alternative_match.group(1)
-                
-                alternatives = [alt.strip().strip('"') for alt in alternatives_str.split(',')]
-                recommended_graphs.extend(alternatives)
+    primary_match = re.search(r"Primary:\s*\[?\"?(\w+)\"?\]?", content)
+    alternative_match = re.search(r"Alternative:\s*\[?\"?([\w,\s\"]+)\"?\]?", content)
 
-        if not recommended_graphs:
-             print(f"[Warning] Could not parse recommendations from LLM response: {content}")
-             recommended_graphs = ["table"] 
+    if primary_match:
+        primary_graph = primary_match.group(1)
+        recommended_graphs.append(primary_graph)
+        if alternative_match:
+            alternatives_str = alternative_match.group(1)
+            
+            alternatives = [alt.strip().strip('"') for alt in alternatives_str.split(',')]
+            recommended_graphs.extend(alternatives)
 
+    recommended_graphs = [str(g) for g in recommended_graphs if isinstance(g, (str, int, float)) and str(g)]
+    if not recommended_graphs:
+        print(f"[Warning] Could not parse recommendations from LLM response: {content}")
+        recommended_graphs = ["table"]
 
-        
+    return recommended_graphs
 
 
-        
-        recommended_graphs = [str(g) for g in recommended_graphs if isinstance(g, (str, int, float))]
-        if not recommended_graphs:
-            print("[Info] No valid graph recommendations parsed. Defaulting to ['table'].")
-            recommended_graphs = ["table"]
+@api.post("/graphrecommender")
+async def recommend_graph(request: GraphRecommendationRequest) -> Dict[str, List[str]]:
+    data = request.sql_result_json
 
+    
+    if not data or not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        raise HTTPException(status_code=400, detail="Invalid input: Expected a list of dictionaries.")
 
+    try:
+        with stage("graph_profile"):
+            profile = profile_result(data)
+            signature = profile_signature(profile)
     except Exception as e:
-        print(f"[Error] LLM failure: {e}\n{traceback.format_exc()}")
-        raise HTTPException(status_code=500, detail="Error generating graph recommendations.")
+        raise HTTPException(status_code=400, detail=f"Failed to profile input data: {e}")
+
+    # Results with the same column profile get the same charts, whichever way they were chosen
+    recommended_graphs = graph_recommendations.get(signature)
+    if recommended_graphs is None:
+        recommended_graphs = recommend_from_profile(profile)
+        if recommended_graphs is None:
+            try:
+                recommended_graphs = await single_flight(
+                    ("graph_llm", signature),
+                    lambda: run_on_resource("graph-llm", GRAPH_LLM_CONCURRENCY, llm_graph_recommendation, data)
+                )
+            except Exception as e:
+                print(f"[Error] LLM failure: {e}\n{traceback.format_exc()}")
+                raise HTTPException(status_code=500, detail="Error generating graph recommendations.")
+        graph_recommendations.set(signature, recommended_graphs)
 
     return {"recommended_graphs": recommended_graphs}
 
@@ -397,7 +671,85 @@ TWILIO_NUMBER = os.getenv("TWILLIO_NUMBER")
 ACCOUNT_SID    = os.getenv("ACCOUNT_SID")
 AUTH_TOKEN    = os.getenv("AUTH_TOKEN")
 
-CHAT_API_URL  = "https://studysyncs.xyz/services/chat"   
+# Empty runs the chat pipeline in-process; set it to send WhatsApp questions to a remote chat service instead
+CHAT_API_URL = os.getenv("CHAT_API_URL", "")
+WHATSAPP_CHAT_TIMEOUT = float(os.getenv("WHATSAPP_CHAT_TIMEOUT", "300"))
+# Twilio's limit for a single WhatsApp message body
+WHATSAPP_MAX_MESSAGE = 1600
+WHATSAPP_SEND_CONCURRENCY = int(os.getenv("WHATSAPP_SEND_CONCURRENCY", "8"))
+
+twilio_client = TwilioClient(ACCOUNT_SID, AUTH_TOKEN) if ACCOUNT_SID and AUTH_TOKEN and TWILIO_NUMBER else None
+chat_http = None
+
+
+@api.on_event("shutdown")
+async def close_http_clients():
+    await job_queue.stop()
+    if chat_http is not None:
+        await chat_http.aclose()
+
+
+async def whatsapp_answer(payload: dict) -> dict:
+    global chat_http
+    if not CHAT_API_URL:
+        db_config, query_request = parse_chat_request(payload)
+        return await run_chat(db_config, query_request)
+
+    if chat_http is None:
+        chat_http = httpx.AsyncClient(timeout=WHATSAPP_CHAT_TIMEOUT, limits=httpx.Limits(max_keepalive_connections=20))
+    r = await chat_http.post(CHAT_API_URL, json=payload)
+    r.raise_for_status()
+    return r.json()
+
+
+def format_whatsapp_reply(result: dict) -> str:
+    if "error" in result:
+        return f"❌ {result['error']}\n{result.get('details', '')}".strip()
+
+    sql      = result.get("sql_query", "<none>")
+    summary  = result.get("summary") or "<none>"
+    title    = result.get("title") or ""
+    rows     = result.get("sql_result")
+    # truncate very long results
+    rows_str = dumps(rows).decode("utf-8")
+    if len(rows_str) > 800:
+        rows_str = rows_str[:800] + "\n…(truncated)"
+
+    msg = (
+        f"✅ *Query OK*\n\n"
+        f"*SQL:*```{sql}```\n\n"
+        f"*Title:* {title}\n\n"
+        f"*Summary:* {summary}\n\n"
+        f"*Rows:*```json\n{rows_str}\n```"
+    )
+    return msg[:WHATSAPP_MAX_MESSAGE]
+
+
+async def whatsapp_reply(payload: dict) -> str:
+    try:
+        return format_whatsapp_reply(await whatsapp_answer(payload))
+    except HTTPException as e:
+        # Only the first line; pipeline errors carry a traceback
+        return f"❌ Error calling chat API:\n{str(e.detail).splitlines()[0] if e.detail else e.status_code}"
+    except Exception as e:
+        return f"❌ Error calling chat API:\n{e}"
+
+
+def send_whatsapp_message(to: str, body: str):
+    sender = TWILIO_NUMBER if TWILIO_NUMBER.startswith("whatsapp:") else f"whatsapp:{TWILIO_NUMBER}"
+    twilio_client.messages.create(from_=sender, to=to, body=body)
+
+
+async def deliver_whatsapp_reply(payload, on_event):
+    to, chat_payload = payload
+    body = await whatsapp_reply(chat_payload)
+    try:
+        await run_on_resource("whatsapp", WHATSAPP_SEND_CONCURRENCY, send_whatsapp_message, to, body)
+    except Exception as e:
+        print(f"[Warning] Could not deliver WhatsApp reply to {to}: {e}")
+
+job_queue.register("whatsapp", deliver_whatsapp_reply)
+
 
 @api.post("/whatsapp")
 async def whatsapp_webhook(From: str = Form(...), Body: str = Form(...)):
@@ -408,6 +760,8 @@ async def whatsapp_webhook(From: str = Form(...), Body: str = Form(...)):
       "database_config": { dbtype, host, user, password, dbname },
       "query_request":   { query }
     }
+    The webhook is acknowledged straight away and the answer is sent through the Twilio REST API
+    once it is ready; without Twilio credentials the answer is returned in the webhook response.
     """
     resp = MessagingResponse()
 
@@ -425,32 +779,12 @@ async def whatsapp_webhook(From: str = Form(...), Body: str = Form(...)):
         )
         return Response(content=str(resp), media_type="application/xml")
 
-    try:
-        r = requests.post(CHAT_API_URL, json=payload, timeout=30)
-        r.raise_for_status()
-        result = r.json()
-    except Exception as e:
-        resp.message(f"❌ Error calling chat API:\n{e}")
-        return Response(content=str(resp), media_type="application/xml")
-
-    # format and send back
-    sql      = result.get("sql_query", "<none>")
-    summary  = result.get("summary", "<none>")
-    title    = result.get("title", "")
-    rows     = result.get("sql_result")
-    # truncate very long results
-    rows_str = json.dumps(rows, indent=2)
-    if len(rows_str) > 800:
-        rows_str = rows_str[:800] + "\n…(truncated)"
-
-    msg = (
-        f"✅ *Query OK*\n\n"
-        f"*SQL:*```{sql}```\n\n"
-        f"*Title:* {title}\n\n"
-        f"*Summary:* {summary}\n\n"
-        f"*Rows:*```json\n{rows_str}\n```"
-    )
-    resp.message(msg)
+    if twilio_client is not None:
+        # Queued per sender, so one busy conversation cannot hold up the others
+        job_queue.submit("whatsapp", (From, payload), From, lane="interactive")
+        resp.message("⏳ Working on it, the answer will follow shortly.")
+    else:
+        resp.message(await whatsapp_reply(payload))
 
     return Response(content=str(resp), media_type="application/xml")
 
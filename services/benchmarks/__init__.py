@@ -0,0 +1 @@
+"""Offline benchmark harness for the services pipeline: stub LLMs, a synthetic IPL database and a load driver."""
@@ -0,0 +1,114 @@
+import argparse
+import random
+import sqlite3
+from pathlib import Path
+
+TEAMS = [
+    "Mumbai Indians", "Chennai Super Kings", "Royal Challengers Bangalore", "Kolkata Knight Riders",
+    "Delhi Capitals", "Punjab Kings", "Rajasthan Royals", "Sunrisers Hyderabad",
+    "Gujarat Titans", "Lucknow Super Giants",
+]
+VENUES = [
+    ("Wankhede Stadium", "Mumbai"), ("M. A. Chidambaram Stadium", "Chennai"), ("M. Chinnaswamy Stadium", "Bengaluru"),
+    ("Eden Gardens", "Kolkata"), ("Arun Jaitley Stadium", "Delhi"), ("Punjab Cricket Association Stadium", "Mohali"),
+    ("Sawai Mansingh Stadium", "Jaipur"), ("Rajiv Gandhi International Stadium", "Hyderabad"),
+    ("Narendra Modi Stadium", "Ahmedabad"), ("Ekana Cricket Stadium", "Lucknow"),
+]
+ROLES = ["batsman", "bowler", "all-rounder", "wicket-keeper"]
+DELIVERIES_PER_MATCH = 240
+PLAYERS_PER_TEAM = 25
+BATCH_ROWS = 50_000
+
+SCHEMA = """
+CREATE TABLE teams (team_id INTEGER PRIMARY KEY, name TEXT NOT NULL, short_name TEXT);
+CREATE TABLE venues (venue_id INTEGER PRIMARY KEY, name TEXT NOT NULL, city TEXT);
+CREATE TABLE players (player_id INTEGER PRIMARY KEY, name TEXT NOT NULL, team_id INTEGER REFERENCES teams(team_id), role TEXT, batting_hand TEXT);
+CREATE TABLE matches (
+    match_id INTEGER PRIMARY KEY, season INTEGER, match_date TEXT,
+    team1_id INTEGER REFERENCES teams(team_id), team2_id INTEGER REFERENCES teams(team_id),
+    venue_id INTEGER REFERENCES venues(venue_id), winner_id INTEGER REFERENCES teams(team_id), win_margin INTEGER
+);
+CREATE TABLE deliveries (
+    delivery_id INTEGER PRIMARY KEY, match_id INTEGER REFERENCES matches(match_id), inning INTEGER,
+    over_number INTEGER, ball INTEGER, batsman TEXT, bowler TEXT,
+    batsman_runs INTEGER, extra_runs INTEGER, is_wicket INTEGER
+);
+"""
+
+
+def _player_name(player_id):
+    return f"Player {player_id:04d}"
+
+
+def build_dataset(path, rows=10_000, tables=10, seed=7):
+    """Create an IPL-like SQLite database with about `rows` deliveries and `tables` tables in total.
+
+    Tables beyond the five core ones are per-season stat tables linked to players/teams, so the
+    schema index and prompt pruning see realistic wide schemas.
+    """
+    path = Path(path)
+    if path.exists():
+        path.unlink()
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+
+    conn.executemany("INSERT INTO teams VALUES (?, ?, ?)", [(i + 1, name, "".join(w[0] for w in name.split())) for i, name in enumerate(TEAMS)])
+    conn.executemany("INSERT INTO venues VALUES (?, ?, ?)", [(i + 1, name, city) for i, (name, city) in enumerate(VENUES)])
+    player_count = len(TEAMS) * PLAYERS_PER_TEAM
+    conn.executemany(
+        "INSERT INTO players VALUES (?, ?, ?, ?, ?)",
+        [(p, _player_name(p), (p - 1) // PLAYERS_PER_TEAM + 1, rng.choice(ROLES), rng.choice(["left", "right"])) for p in range(1, player_count + 1)],
+    )
+
+    match_count = max(1, rows // DELIVERIES_PER_MATCH)
+    matches = []
+    for match_id in range(1, match_count + 1):
+        team1, team2 = rng.sample(range(1, len(TEAMS) + 1), 2)
+        season = 2008 + match_id * 17 // max(match_count, 1)
+        matches.append((match_id, season, f"{season}-04-{match_id % 28 + 1:02d}", team1, team2, rng.randint(1, len(VENUES)), rng.choice([team1, team2]), rng.randint(1, 100)))
+    conn.executemany("INSERT INTO matches VALUES (?, ?, ?, ?, ?, ?, ?, ?)", matches)
+
+    def deliveries():
+        for delivery_id in range(1, rows + 1):
+            match_id = (delivery_id - 1) // DELIVERIES_PER_MATCH % match_count + 1
+            ball_index = (delivery_id - 1) % DELIVERIES_PER_MATCH
+            yield (
+                delivery_id, match_id, ball_index // 120 + 1, ball_index % 120 // 6 + 1, ball_index % 6 + 1,
+                _player_name(rng.randint(1, player_count)), _player_name(rng.randint(1, player_count)),
+                rng.choice((0, 0, 0, 1, 1, 2, 4, 6)), int(rng.random() < 0.05), int(rng.random() < 0.04),
+            )
+
+    batch = []
+    for record in deliveries():
+        batch.append(record)
+        if len(batch) >= BATCH_ROWS:
+            conn.executemany("INSERT INTO deliveries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO deliveries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+
+    for index in range(max(0, tables - 5)):
+        name = f"season_stats_{index:04d}"
+        conn.execute(
+            f"CREATE TABLE {name} (stat_id INTEGER PRIMARY KEY, player_id INTEGER REFERENCES players(player_id), "
+            f"team_id INTEGER REFERENCES teams(team_id), metric_{index}_value REAL, metric_{index}_rank INTEGER)"
+        )
+        conn.executemany(
+            f"INSERT INTO {name} VALUES (?, ?, ?, ?, ?)",
+            [(i, rng.randint(1, player_count), rng.randint(1, len(TEAMS)), rng.random() * 100, i) for i in range(1, 21)],
+        )
+
+    conn.execute("CREATE INDEX deliveries_match ON deliveries(match_id)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a synthetic IPL SQLite database for benchmarks.")
+    parser.add_argument("path")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--tables", type=int, default=10)
+    args = parser.parse_args()
+    print(build_dataset(args.path, args.rows, args.tables))
@@ -0,0 +1,165 @@
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+# Question keywords -> SQL over the synthetic dataset in benchmarks/dataset.py
+CANNED_SQL = [
+    (("batsm", "runs"), "SELECT batsman, SUM(batsman_runs) AS runs FROM deliveries GROUP BY batsman ORDER BY runs DESC LIMIT 5"),
+    (("wicket",), "SELECT bowler, COUNT(*) AS wickets FROM deliveries WHERE is_wicket = 1 GROUP BY bowler ORDER BY wickets DESC LIMIT 5"),
+    (("venue",), "SELECT v.name, COUNT(*) AS matches FROM matches m JOIN venues v ON v.venue_id = m.venue_id GROUP BY v.name ORDER BY matches DESC"),
+    (("season",), "SELECT season, COUNT(*) AS matches FROM matches GROUP BY season ORDER BY season"),
+    (("team",), "SELECT t.name, COUNT(*) AS wins FROM matches m JOIN teams t ON t.team_id = m.winner_id GROUP BY t.name ORDER BY wins DESC"),
+    (("all deliveries", "every delivery"), "SELECT * FROM deliveries"),
+]
+DEFAULT_SQL = "SELECT COUNT(*) AS matches FROM matches"
+
+
+def sql_for(text):
+    text = text.lower()
+    for keywords, sql in CANNED_SQL:
+        if any(keyword in text for keyword in keywords):
+            return sql
+    return DEFAULT_SQL
+
+
+def _question(prompt):
+    # The pipeline's prompts quote the user's question: Question: "..."
+    match = re.search(r'Question:\s*"([^"\n]*)"', prompt)
+    return match.group(1) if match else prompt
+
+
+class LLMCallCounter:
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, prompt_tokens, completion_tokens):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def snapshot(self):
+        with self._lock:
+            return {"calls": self.calls, "prompt_tokens": self.prompt_tokens, "completion_tokens": self.completion_tokens}
+
+
+def _tokens(text):
+    # Roughly 4 characters per token, close enough for relative comparisons
+    return max(1, len(text) // 4)
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic stand-in for ChatGroq.
+
+    Agent prompts get a ReAct transcript that lists tables agent_steps times before giving the
+    canned SQL as its final answer; summary and title prompts get fixed text; structured output
+    returns the canned SQL. Every call sleeps latency seconds (plus latency_per_token per
+    completion token) and reports token usage like the real client.
+    """
+
+    model_name: str = "fake-llama"
+    latency: float = 0.5
+    latency_per_token: float = 0.0
+    agent_steps: int = 1
+    counter: Optional[Any] = None
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def _respond(self, prompt):
+        if "Please provide a title" in prompt:
+            return "Synthetic IPL Results At A Glance"
+        if "Please provide a clear, concise summary" in prompt:
+            return "The query returned the requested IPL statistics; the leading entries are listed first."
+        if "Action Input" in prompt or "sql_db_query" in prompt:
+            if prompt.count("Observation:") < self.agent_steps:
+                return "Thought: I should look at the tables in the database.\nAction: sql_db_list_tables\nAction Input: "
+            return f"Thought: I now know the final answer.\nFinal Answer: {sql_for(_question(prompt))}"
+        return sql_for(prompt)
+
+    def _simulate(self, prompt, content):
+        prompt_tokens, completion_tokens = _tokens(prompt), _tokens(content)
+        time.sleep(self.latency + self.latency_per_token * completion_tokens)
+        if self.counter is not None:
+            self.counter.add(prompt_tokens, completion_tokens)
+        return prompt_tokens, completion_tokens
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs):
+        prompt = "\n".join(str(message.content) for message in messages)
+        content = self._respond(prompt)
+        prompt_tokens, completion_tokens = self._simulate(prompt, content)
+        message = AIMessage(
+            content=content,
+            usage_metadata={"input_tokens": prompt_tokens, "output_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+        )
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={
+                "model_name": self.model_name,
+                "token_usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+            },
+        )
+
+    def with_structured_output(self, schema, **kwargs):
+        def respond(prompt):
+            prompt = prompt if isinstance(prompt, str) else str(prompt)
+            sql = sql_for(_question(prompt))
+            self._simulate(prompt, sql)
+            return schema(sql=sql, tables=[])
+
+        return RunnableLambda(respond)
+
+
+class FakeGroqClient:
+    """Stand-in for groq.Groq covering the chat.completions.create calls made by api.py."""
+
+    def __init__(self, latency=0.2, counter=None):
+        self.latency = latency
+        self.counter = counter
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, messages, model=None, **kwargs):
+        prompt = "\n".join(message["content"] for message in messages)
+        if "graph type" in prompt:
+            content = "Primary: bar\nAlternative: line, pie"
+        elif "autocompletions" in prompt:
+            term = re.search(r'partial term: "(.*?)"', prompt)
+            term = term.group(1) if term else ""
+            content = json.dumps({"suggestions": [f"{term} by season", f"{term} by venue", f"{term} for each team"]})
+        else:
+            content = json.dumps([
+                "Who are the top 5 batsmen by runs?",
+                "Which bowlers took the most wickets?",
+                "How many matches were played each season?",
+            ])
+
+        prompt_tokens, completion_tokens = _tokens(prompt), _tokens(content)
+        time.sleep(self.latency)
+        if self.counter is not None:
+            self.counter.add(prompt_tokens, completion_tokens)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens),
+        )
+
+
+def register_fake_backend(name="fake", latency=0.0, client_latency=0.0, agent_steps=1, counter=None):
+    """Register the fakes with the LLM gateway; select them with utils.llm.use_backend(name)."""
+    from utils import llm
+
+    llm.register_backend(
+        name,
+        lambda api_key: FakeGroqClient(latency=client_latency, counter=counter),
+        lambda model, api_key: FakeChatModel(model_name=model, latency=latency, agent_steps=agent_steps, counter=counter),
+    )
@@ -0,0 +1,183 @@
+"""Drive the FastAPI app in-process against a synthetic IPL SQLite database with stub LLMs.
+
+Run from the services/ directory, e.g.:
+
+    python -m benchmarks.run --rows 1000 100000 --tables 10 100 --concurrency 1 8 32
+    python -m benchmarks.run --endpoints chat --modes agent fast --llm-latency 0.8
+
+Needs httpx in addition to requirements.txt. Reports p50/p99 latency, throughput per
+concurrency level, LLM calls/tokens per request and peak RSS. Exits with status 1 if any
+request failed, after printing the first failing responses.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+QUESTIONS = [
+    "Who are the top 5 batsmen by runs?",
+    "Which bowlers took the most wickets?",
+    "How many matches were played at each venue?",
+    "How many matches were played each season?",
+    "Which team has won the most matches?",
+    "How many matches are there?",
+]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def peak_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def install_fakes(counter, llm_latency, agent_steps, client_latency):
+    from benchmarks.fake_llm import register_fake_backend
+    from utils import llm
+
+    register_fake_backend("benchmark", latency=llm_latency, client_latency=client_latency, agent_steps=agent_steps, counter=counter)
+    llm.use_backend("benchmark")
+
+
+def build_request(endpoint, database_config, index, mode, sample_rows):
+    question = QUESTIONS[index % len(QUESTIONS)]
+    if endpoint == "chat":
+        return "/chat", {
+            "database_config": database_config,
+            "query_request": {"query": question, "generation_mode": mode},
+        }
+    if endpoint == "recommend":
+        return "/recommend", {"database_config": database_config}
+    if endpoint == "search-completions":
+        return "/search-completions", {"term": question.split()[index % 4], "limit": 5, "database_config": database_config}
+    if endpoint == "graphrecommender":
+        return "/graphrecommender", {"sql_result_json": sample_rows}
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+async def run_level(http, endpoint, database_config, concurrency, requests, mode, sample_rows):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = []
+
+    async def one(index):
+        path, payload = build_request(endpoint, database_config, index, mode, sample_rows)
+        async with semaphore:
+            started = time.perf_counter()
+            response = await http.post(path, json=payload)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200 or "error" in response.json():
+                failures.append(f"{path} -> {response.status_code}: {response.text[:300]}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    wall = time.perf_counter() - started
+    return {
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "max": max(latencies) if latencies else 0.0,
+        "throughput": requests / wall if wall else 0.0,
+        "wall": wall,
+        "errors": len(failures),
+        "failures": failures[:3],
+    }
+
+
+async def main(args):
+    os.environ.setdefault("QUERY_CACHE_ENABLED", "true" if args.cache else "false")
+    os.environ.setdefault("CACHE_BACKEND", "memory")
+    os.environ.setdefault("LLM_CACHE_MAX_TEMPERATURE", "0.2" if args.cache else "-1")
+    os.environ.setdefault("SCHEMA_INDEX_DIR", str(Path(args.workdir) / "schema_index"))
+    os.environ.setdefault("LOCAL_DATA_ROOT", args.workdir)
+
+    import httpx
+    import api as service
+    from benchmarks.dataset import build_dataset
+    from benchmarks.fake_llm import LLMCallCounter
+
+    counter = LLMCallCounter()
+    install_fakes(counter, args.llm_latency, args.agent_steps, args.client_latency)
+    sample_rows = [{"season": 2008 + i, "matches": 50 + i * 3} for i in range(10)]
+
+    report = []
+    transport = httpx.ASGITransport(app=service.api)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as http:
+        for rows in args.rows:
+            for tables in args.tables:
+                db_path = Path(args.workdir) / f"ipl_{rows}_{tables}.sqlite3"
+                if not db_path.exists():
+                    build_dataset(db_path, rows, tables)
+                database_config = {"dbtype": "sqlite", "host": "local", "user": "benchmark", "password": "", "dbname": str(db_path)}
+
+                for endpoint in args.endpoints:
+                    modes = args.modes if endpoint == "chat" else ["-"]
+                    for mode in modes:
+                        for concurrency in args.concurrency:
+                            requests = max(args.requests, concurrency)
+                            before = counter.snapshot()
+                            result = await run_level(http, endpoint, database_config, concurrency, requests, mode, sample_rows)
+                            after = counter.snapshot()
+                            result.update({
+                                "endpoint": endpoint, "mode": mode, "rows": rows, "tables": tables,
+                                "concurrency": concurrency, "requests": requests,
+                                "llm_calls_per_request": (after["calls"] - before["calls"]) / requests,
+                                "prompt_tokens_per_request": (after["prompt_tokens"] - before["prompt_tokens"]) / requests,
+                                "completion_tokens_per_request": (after["completion_tokens"] - before["completion_tokens"]) / requests,
+                                "peak_rss_mb": peak_rss_mb(),
+                            })
+                            report.append(result)
+                            print(
+                                f"{endpoint:<19} mode={mode:<5} rows={rows:<9} tables={tables:<5} c={concurrency:<4} "
+                                f"p50={result['p50']:.3f}s p99={result['p99']:.3f}s rps={result['throughput']:.1f} "
+                                f"llm_calls/req={result['llm_calls_per_request']:.1f} "
+                                f"prompt_tokens/req={result['prompt_tokens_per_request']:.0f} "
+                                f"errors={result['errors']} rss={result['peak_rss_mb']:.0f}MB"
+                            )
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    failed = [result for result in report if result["errors"]]
+    if failed:
+        for result in failed:
+            print(f"FAILED {result['endpoint']} mode={result['mode']} rows={result['rows']} tables={result['tables']} "
+                  f"c={result['concurrency']}: {result['errors']}/{result['requests']} requests", file=sys.stderr)
+            for failure in result["failures"]:
+                print(f"  {failure}", file=sys.stderr)
+        raise SystemExit(1)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for the voxalize services pipeline.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 100_000], help="deliveries rows per dataset scale")
+    parser.add_argument("--tables", type=int, nargs="+", default=[10, 100], help="total tables per dataset scale")
+    parser.add_argument("--endpoints", nargs="+", default=["chat", "recommend", "search-completions", "graphrecommender"])
+    parser.add_argument("--modes", nargs="+", default=["agent", "fast"], help="SQL generation modes for /chat")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=32, help="requests per concurrency level")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per stub ChatGroq call")
+    parser.add_argument("--client-latency", type=float, default=0.2, help="seconds per stub Groq client call")
+    parser.add_argument("--agent-steps", type=int, default=2, help="tool steps the stub agent takes before answering")
+    parser.add_argument("--cache", action="store_true", help="keep the NL->SQL and LLM response caches enabled")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "voxalize-bench"))
+    parser.add_argument("--output", help="write the full report as JSON")
+    args = parser.parse_args(argv)
+    Path(args.workdir).mkdir(parents=True, exist_ok=True)
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
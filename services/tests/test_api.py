@@ -0,0 +1,85 @@
+from fastapi.testclient import TestClient
+
+import api
+
+
+client = TestClient(api.api)
+
+UNSUPPORTED_DATABASE = {"dbtype": "unsupported", "host": "", "user": "", "password": "", "dbname": ""}
+
+
+def test_search_completions_without_database():
+    response = client.post("/search-completions", json={"term": "sel", "limit": 5})
+
+    assert response.status_code == 200
+    assert isinstance(response.json()["completions"], list)
+
+
+def test_admin_endpoints_are_closed_without_a_configured_token(monkeypatch):
+    monkeypatch.setattr(api, "admin_token", None)
+
+    assert client.post("/admin/schema/refresh", json=UNSUPPORTED_DATABASE).status_code == 403
+    assert client.post("/admin/schema/refresh", json=UNSUPPORTED_DATABASE, headers={"X-Admin-Token": ""}).status_code == 403
+
+
+def test_admin_endpoints_check_the_token(monkeypatch):
+    monkeypatch.setattr(api, "admin_token", "s3cret")
+
+    assert client.post("/admin/schema/refresh", json=UNSUPPORTED_DATABASE, headers={"X-Admin-Token": "wrong"}).status_code == 403
+    # Past the token check the request fails on the database type instead
+    assert client.post("/admin/schema/refresh", json=UNSUPPORTED_DATABASE, headers={"X-Admin-Token": "s3cret"}).status_code == 400
+
+
+def test_metrics_need_the_admin_token_and_hide_database_identities(monkeypatch, tmp_path):
+    from sqlalchemy import create_engine
+    from utils.db import pool_label
+
+    monkeypatch.setattr(api, "admin_token", "s3cret")
+    assert client.get("/metrics").status_code == 403
+    assert client.get("/metrics", headers={"X-Admin-Token": "s3cret"}).status_code == 200
+
+    label = pool_label(create_engine(f"sqlite:///{tmp_path / 'customer_db.sqlite'}"))
+    assert len(label) == 12 and "customer_db" not in label
+
+
+def test_chat_jobs_are_submitted_polled_and_succeed(monkeypatch, tmp_path):
+    import asyncio
+
+    import httpx
+
+    from benchmarks.dataset import build_dataset
+    from benchmarks.fake_llm import register_fake_backend
+    from utils import dialects, llm, schema_index
+
+    build_dataset(tmp_path / "ipl.sqlite3", rows=500, tables=5)
+    monkeypatch.setattr(dialects, "LOCAL_DATA_ROOT", str(tmp_path))
+    monkeypatch.setattr(schema_index, "SCHEMA_INDEX_DIR", tmp_path / "schema_index")
+    register_fake_backend("jobs-test")
+    llm.use_backend("jobs-test")
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=api.api)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            response = await http.post("/chat/jobs", json={
+                "database_config": {"dbtype": "sqlite", "host": "local", "user": "test", "password": "", "dbname": "ipl.sqlite3"},
+                "query_request": {"query": "How many matches were played each season?", "generation_mode": "fast"},
+                "lane": "interactive",
+            })
+            assert response.status_code == 202
+            job_id = response.json()["job_id"]
+            for _ in range(200):
+                job = (await http.get(f"/chat/jobs/{job_id}")).json()
+                if job["status"] not in ("queued", "running"):
+                    break
+                await asyncio.sleep(0.05)
+        await api.job_queue.stop()
+        return job
+
+    try:
+        job = asyncio.run(scenario())
+    finally:
+        llm.use_backend("groq")
+
+    assert job["status"] == "succeeded", job["error"]
+    assert job["result"]["sql_query"].startswith("SELECT season, COUNT(*)")
+    assert job["result"]["title"] == "Synthetic IPL Results At A Glance"
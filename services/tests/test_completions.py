@@ -0,0 +1,37 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from utils import completions
+from utils.db import get_schema_details
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE players (id INTEGER PRIMARY KEY, name TEXT, runs INTEGER)"))
+        for number in range(50):
+            connection.execute(text("INSERT INTO players (name, runs) VALUES (:name, :runs)"), {"name": f"player {number}", "runs": number})
+    return engine
+
+
+def test_values_are_sampled_from_a_bounded_prefix(monkeypatch, engine):
+    monkeypatch.setattr(completions, "COMPLETION_SAMPLE_ROWS", 5)
+    tables = {"players": {"columns": [{"name": "name", "type": "TEXT"}, {"name": "runs", "type": "INTEGER"}]}}
+
+    values = completions.sample_column_values(engine, tables)
+
+    assert len(values) == 5
+    assert set(values) <= {f"player {number}" for number in range(50)}
+
+
+def test_schema_loads_sample_values_into_the_index(monkeypatch, engine):
+    # Run the background sample inline
+    monkeypatch.setattr(completions, "submit_to_resource", lambda resource, workers, fn, *args: fn(*args))
+    indexes = completions.CompletionIndexes()
+    monkeypatch.setattr(completions, "completion_indexes", indexes)
+
+    get_schema_details(engine, refresh=True)
+    index = indexes.build(engine)
+
+    assert "player 7" in index.search("player 7", 5)
@@ -0,0 +1,50 @@
+import pytest
+from fastapi import HTTPException
+
+from utils import dialects
+
+
+def test_local_databases_are_disabled_without_a_root(monkeypatch):
+    monkeypatch.setattr(dialects, "LOCAL_DATA_ROOT", "")
+
+    with pytest.raises(HTTPException) as error:
+        dialects.get_dialect("sqlite").resolve_database("anything.sqlite3")
+    assert error.value.status_code == 403
+
+
+def test_local_databases_stay_inside_the_root(monkeypatch, tmp_path):
+    root = tmp_path / "data"
+    root.mkdir()
+    (root / "shop.sqlite3").touch()
+    (tmp_path / "outside.sqlite3").touch()
+    (root / "link.sqlite3").symlink_to(tmp_path / "outside.sqlite3")
+    monkeypatch.setattr(dialects, "LOCAL_DATA_ROOT", str(root))
+    sqlite = dialects.get_dialect("sqlite")
+
+    assert sqlite.resolve_database("shop.sqlite3") == str(root / "shop.sqlite3")
+    assert sqlite.resolve_database(str(root / "shop.sqlite3")) == str(root / "shop.sqlite3")
+    for database in ("../outside.sqlite3", str(tmp_path / "outside.sqlite3"), "link.sqlite3", "/etc/passwd"):
+        with pytest.raises(HTTPException) as error:
+            sqlite.resolve_database(database)
+        assert error.value.status_code == 400
+
+
+def test_duckdb_file_connects_and_reflects(monkeypatch, tmp_path):
+    import duckdb
+    from utils.db import configure_db, dispose_engines
+
+    path = tmp_path / "shop.duckdb"
+    connection = duckdb.connect(str(path))
+    connection.execute("CREATE TABLE orders (id INTEGER, customer VARCHAR)")
+    connection.execute("INSERT INTO orders VALUES (1, 'ada'), (2, 'grace')")
+    connection.execute("CREATE VIEW big_orders AS SELECT * FROM orders WHERE id > 1")
+    connection.close()
+    monkeypatch.setattr(dialects, "LOCAL_DATA_ROOT", str(tmp_path))
+
+    try:
+        db, engine = configure_db("duckdb", "", "", "", "shop.duckdb")
+        assert set(db.get_usable_table_names()) == {"orders", "big_orders"}
+        assert "customer VARCHAR" in db.get_table_info(["orders"])
+        assert db.run("SELECT customer FROM big_orders") == "[('grace',)]"
+    finally:
+        dispose_engines()
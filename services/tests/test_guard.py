@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from utils import guard
+
+CONNECTION = SimpleNamespace(dialect=SimpleNamespace(name="postgresql"))
+
+
+@pytest.fixture
+def plans(monkeypatch):
+    """Planner estimates per query: {"full": plan without LIMIT, "limited": plan with one}."""
+    plans = {}
+    monkeypatch.setattr(guard, "QUERY_GUARD_ENABLED", True)
+    monkeypatch.setattr(guard, "estimate_plan", lambda connection, sql_query: plans["limited" if "LIMIT" in sql_query else "full"])
+    return plans
+
+
+def test_large_results_get_a_limit(plans):
+    plans["full"] = {"cost": 5000.0, "rows": 5_000_000.0, "examined": None}
+    plans["limited"] = {"cost": 10.0, "rows": 100.0, "examined": None}
+
+    assert guard.guard_query(CONNECTION, "SELECT * FROM deliveries;", 100) == "SELECT * FROM deliveries\nLIMIT 100"
+
+
+def test_small_results_and_existing_limits_are_left_alone(plans):
+    plans["full"] = {"cost": 50.0, "rows": 20.0, "examined": None}
+    plans["limited"] = {"cost": 5000.0, "rows": 5_000_000.0, "examined": None}
+
+    assert guard.guard_query(CONNECTION, "SELECT * FROM teams", 100) == "SELECT * FROM teams"
+    assert guard.guard_query(CONNECTION, "SELECT * FROM deliveries LIMIT 10", 100) == "SELECT * FROM deliveries LIMIT 10"
+
+
+def test_plans_over_budget_even_with_a_limit_are_rejected(monkeypatch, plans):
+    monkeypatch.setattr(guard, "QUERY_GUARD_MAX_COST", 1000.0)
+    plans["full"] = {"cost": 1e9, "rows": 10.0, "examined": None}
+    plans["limited"] = {"cost": 1e9, "rows": 10.0, "examined": None}
+
+    with pytest.raises(HTTPException) as error:
+        guard.guard_query(CONNECTION, "SELECT a.id FROM deliveries a CROSS JOIN deliveries b ORDER BY random()", 100)
+    assert error.value.status_code == 422
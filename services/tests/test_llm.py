@@ -0,0 +1,42 @@
+import pytest
+
+from benchmarks.fake_llm import LLMCallCounter, register_fake_backend
+from utils import llm
+
+
+@pytest.fixture
+def counter():
+    counter = LLMCallCounter()
+    register_fake_backend("test", counter=counter)
+    llm.use_backend("test")
+    yield counter
+    llm.use_backend("groq")
+
+
+def test_tasks_are_routed_to_their_model():
+    assert llm.model_for("title") == llm.LLM_FAST_MODEL
+    assert llm.model_for("sql") == llm.LLM_MODEL
+
+
+def test_deterministic_completions_are_cached(counter):
+    messages = [{"role": "user", "content": "Recommend the best graph type."}]
+
+    first = llm.complete("graph_recommend", messages, temperature=0.2)
+    second = llm.complete("graph_recommend", messages, temperature=0.2)
+
+    assert first == second == "Primary: bar\nAlternative: line, pie"
+    assert counter.snapshot()["calls"] == 1
+
+
+def test_sampled_completions_are_not_cached(counter):
+    messages = [{"role": "user", "content": "Suggest questions."}]
+
+    llm.complete("recommend", messages, temperature=0.7)
+    llm.complete("recommend", messages, temperature=0.7)
+
+    assert counter.snapshot()["calls"] == 2
+
+
+def test_chat_models_are_shared_per_model(counter):
+    assert llm.chat_model("sql") is llm.chat_model("summary")
+    assert llm.chat_model("title") is not llm.chat_model("sql")
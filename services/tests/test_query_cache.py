@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+from utils import query_cache as query_cache_module
+from utils.query_cache import QueryCache
+
+IDENTITY = "postgresql://analyst@db/ipl"
+ENTRY = {"sql_query": "SELECT COUNT(*) FROM matches", "generation_seconds": 2.0}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(query_cache_module, "QUERY_CACHE_ENABLED", True)
+    monkeypatch.setattr(query_cache_module, "QUERY_CACHE_SIMILARITY", False)
+    cache = QueryCache()
+    cache.store(IDENTITY, "v1", "How many matches were played?", ENTRY)
+    return cache
+
+
+def test_exact_and_normalized_questions_hit(cache):
+    assert cache.lookup(IDENTITY, "v1", "How many matches were played?") == (ENTRY, "exact")
+    assert cache.lookup(IDENTITY, "v1", "  how many MATCHES were played ") == (ENTRY, "exact")
+    assert cache.lookup(IDENTITY, "v1", "How many matches were won?") == (None, None)
+
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["misses"]) == (2, 1)
+
+
+def test_similar_questions_hit_only_with_the_same_numbers(monkeypatch, cache):
+    monkeypatch.setattr(query_cache_module, "QUERY_CACHE_SIMILARITY", True)
+    monkeypatch.setattr(query_cache_module, "QUERY_CACHE_SIMILARITY_THRESHOLD", 0.6)
+    cache.store(IDENTITY, "v1", "Who are the top 5 batsmen by runs?", ENTRY)
+
+    assert cache.lookup(IDENTITY, "v1", "Who are the top 5 batsmen by total runs?") == (ENTRY, "similar")
+    assert cache.lookup(IDENTITY, "v1", "Who are the top 10 batsmen by total runs?") == (None, None)
+
+
+def test_entries_expire_after_the_ttl(monkeypatch, cache):
+    expired = time.time() + query_cache_module.QUERY_CACHE_SQL_TTL + 1
+    monkeypatch.setattr(time, "time", lambda: expired)
+
+    assert cache.lookup(IDENTITY, "v1", "How many matches were played?") == (None, None)
+
+
+def test_a_refreshed_schema_misses_entries_of_the_old_version(cache):
+    # The schema fingerprint is part of the key, so a refresh that changes it invalidates every entry
+    assert cache.lookup(IDENTITY, "v2", "How many matches were played?") == (None, None)
+    assert cache.lookup("postgresql://analyst@db/other", "v1", "How many matches were played?") == (None, None)
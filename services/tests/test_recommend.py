@@ -0,0 +1,22 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from utils.recommend import check_sql_runs
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE teams (id INTEGER PRIMARY KEY, name TEXT)"))
+        connection.execute(text("CREATE TABLE players (id INTEGER PRIMARY KEY, team_id INTEGER, name TEXT)"))
+    return engine
+
+
+def test_joins_with_repeated_column_names_compile(engine):
+    check_sql_runs(engine, "SELECT t.id, p.id, t.name, p.name FROM teams t JOIN players p ON p.team_id = t.id LIMIT 5")
+
+
+def test_unknown_columns_do_not_compile(engine):
+    with pytest.raises(Exception):
+        check_sql_runs(engine, "SELECT missing FROM teams")
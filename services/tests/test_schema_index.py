@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import create_engine
+
+from utils import db, schema_index
+
+TABLES = {
+    "teams": {"columns": [{"name": "id"}, {"name": "name"}], "foreign_keys": []},
+    "players": {"columns": [{"name": "id"}, {"name": "team_id"}], "foreign_keys": [{"referred_table": "teams"}]},
+}
+
+
+@pytest.fixture
+def fingerprint():
+    return {"value": "v1"}
+
+
+@pytest.fixture
+def engine(monkeypatch, tmp_path, fingerprint):
+    monkeypatch.setattr(schema_index, "SCHEMA_INDEX_DIR", tmp_path / "schema_index")
+    monkeypatch.setattr(schema_index, "get_schema_details", lambda engine: TABLES)
+    monkeypatch.setattr(schema_index, "get_cached_fingerprint", lambda engine: fingerprint["value"])
+    return create_engine(f"sqlite:///{tmp_path / 'ipl.sqlite3'}")
+
+
+def _index_files():
+    return sorted(path.name for path in schema_index.SCHEMA_INDEX_DIR.glob("*.json"))
+
+
+def test_a_new_schema_version_replaces_the_old_index_file(engine, fingerprint):
+    schema_index.get_schema_index(engine)
+    first = _index_files()
+    fingerprint["value"] = "v2"
+    schema_index.get_schema_index(engine)
+
+    assert len(first) == 1
+    assert len(_index_files()) == 1 and _index_files() != first
+
+
+def test_invalidating_a_schema_deletes_its_index_files(engine):
+    schema_index.get_schema_index(engine)
+
+    db.invalidate_schema(db.schema_identity(engine))
+
+    assert _index_files() == []
+
+
+def test_evicted_engines_lose_their_index_files(engine):
+    schema_index.get_schema_index(engine)
+
+    db._forget_evicted([{"engine": engine}])
+
+    assert _index_files() == []
@@ -0,0 +1,5 @@
+def test_api_imports():
+    import api
+
+    paths = {route.path for route in api.api.routes}
+    assert {"/chat", "/metrics", "/search-completions"} <= paths
@@ -0,0 +1,55 @@
+import pytest
+
+from utils.sql_ast import InvalidSQL, validate_sql
+
+
+@pytest.mark.parametrize("sql_query, dialect", [
+    ("SELECT * FROM read_csv_auto('/etc/passwd')", "duckdb"),
+    ("SELECT * FROM read_parquet('s3://bucket/data.parquet')", "duckdb"),
+    ("SELECT * FROM glob('/*')", "duckdb"),
+    ("SELECT * FROM sqlite_scan('/srv/cache.sqlite3', 'entries')", "duckdb"),
+    ("SELECT * FROM '/etc/passwd'", "duckdb"),
+    ("SELECT pg_read_file('/etc/passwd')", "postgresql"),
+    ("SELECT LOAD_FILE('/etc/passwd')", "mysql"),
+    ("SELECT load_extension('evil')", "sqlite"),
+])
+def test_file_reading_functions_are_rejected(sql_query, dialect):
+    with pytest.raises(InvalidSQL):
+        validate_sql(sql_query, dialect)
+
+
+def test_ordinary_table_functions_are_allowed():
+    assert validate_sql("SELECT * FROM generate_series(1, 3)", "duckdb")
+
+
+SCHEMA = {"teams": ["id", "name"], "players": ["id", "team_id", "name"]}
+
+
+@pytest.mark.parametrize("sql_query", [
+    "WITH squads AS (SELECT team_id, COUNT(*) AS size FROM players GROUP BY team_id) SELECT t.name, s.size FROM teams t JOIN squads s ON s.team_id = t.id",
+    "SELECT name FROM teams UNION SELECT name FROM players",
+])
+def test_ctes_and_set_operations_are_accepted(sql_query):
+    assert validate_sql(sql_query, "postgresql", SCHEMA)
+
+
+@pytest.mark.parametrize("sql_query, dialect", [
+    ("SELECT name FROM teams; DROP TABLE teams", "postgresql"),
+    ("SELECT name FROM teams; SELECT name FROM players", "postgresql"),
+    ("SELECT name FROM teams FOR UPDATE", "postgresql"),
+    ("SELECT name INTO backup FROM teams", "postgresql"),
+    ("SELECT name FROM teams INTO OUTFILE '/tmp/teams.csv'", "mysql"),
+    ("SELECT salary FROM players", "postgresql"),
+    ("SELECT p.salary FROM players p", "postgresql"),
+    ("SELECT name FROM coaches", "postgresql"),
+])
+def test_unsafe_or_unknown_queries_are_rejected(sql_query, dialect):
+    with pytest.raises(InvalidSQL):
+        validate_sql(sql_query, dialect, SCHEMA)
+
+
+def test_foreign_operators_are_rewritten_for_the_target_dialect():
+    sql_query = validate_sql("SELECT name FROM teams WHERE name ILIKE '%kings%'", "mysql", SCHEMA)
+
+    assert "ILIKE" not in sql_query.upper()
+    assert "LIKE" in sql_query.upper()
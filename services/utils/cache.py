@@ -0,0 +1,164 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import orjson
+from utils.results import dumps
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "cache.sqlite3")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class MemoryCache:
+    """Thread-safe in-process LRU with optional per-entry TTL."""
+
+    def __init__(self, namespace, max_entries=1024, ttl=None):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl if ttl else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """Cache shared between worker processes on one host, persisted in a SQLite file."""
+
+    def __init__(self, namespace, max_entries=1024, ttl=None, path=CACHE_SQLITE_PATH):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,"
+            " expires_at REAL, last_used REAL NOT NULL, PRIMARY KEY (namespace, key))"
+        )
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] < now:
+                self._conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+                return None
+            self._conn.execute(
+                "UPDATE cache_entries SET last_used = ? WHERE namespace = ? AND key = ?", (now, self.namespace, key)
+            )
+        return orjson.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, dumps(value), now + ttl if ttl else None, now),
+            )
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                " SELECT key FROM cache_entries WHERE namespace = ? ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.namespace, self.namespace, self.max_entries),
+            )
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+
+
+class RedisCache:
+    """Redis (or any Redis-compatible server) backed cache; eviction follows the server's maxmemory policy.
+
+    Pass client= to use an existing connection, e.g. a fakeredis instance in tests.
+    """
+
+    def __init__(self, namespace, max_entries=None, ttl=None, client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(REDIS_URL)
+        self.namespace = namespace
+        self.ttl = ttl
+        self._client = client
+
+    def _key(self, key):
+        return f"voxalize:{self.namespace}:{key}"
+
+    def get(self, key):
+        value = self._client.get(self._key(key))
+        return orjson.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        ttl = ttl if ttl is not None else self.ttl
+        self._client.set(self._key(key), dumps(value), ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self._client.delete(self._key(key))
+
+    def clear(self):
+        for key in self._client.scan_iter(self._key("*")):
+            self._client.delete(key)
+
+    def __len__(self):
+        return sum(1 for _ in self._client.scan_iter(self._key("*")))
+
+
+_BACKENDS = {
+    "memory": MemoryCache,
+    "sqlite": SQLiteCache,
+    "redis": RedisCache,
+}
+
+
+def make_cache(namespace, max_entries=1024, ttl=None, backend=None):
+    """Cache for one namespace using the backend selected by CACHE_BACKEND (memory, sqlite or redis)."""
+    backend = backend or CACHE_BACKEND
+    if backend not in _BACKENDS:
+        raise ValueError(f"Unsupported cache backend: {backend}. Choose one of {', '.join(_BACKENDS)}.")
+    return _BACKENDS[backend](namespace, max_entries=max_entries, ttl=ttl)
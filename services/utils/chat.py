@@ -1,225 +1,333 @@
 from fastapi import HTTPException
-from langchain_groq import ChatGroq
-from utils.db import configure_db, extract_sql_query, is_valid_sql
+from utils.dialects import get_dialect
+from utils.db import configure_db, get_cached_fingerprint, get_database_schema, get_schema_details, schema_identity
+from utils.executor import submit_title
+from utils.completions import completion_indexes
+from utils.guard import check_cancelled, guard_query, running_query
+from utils.llm import chat_model
+from utils.query_cache import QUERY_CACHE_RESULT_TTL, query_cache
+from utils.schema_index import relevant_tables
+from utils.sql_ast import extract_sql_query, validate_sql
+from utils.trace import current_trace, trace_scope
+from utils.metrics import record_query_result, stage
+from utils.results import describe_result, dumps, format_result
 from langchain_community.agent_toolkits.sql.base import create_sql_agent, SQLDatabaseToolkit
 from langchain.agents.agent_types import AgentType
 from sqlalchemy import text
-import json
 from dotenv import load_dotenv
 import os
-from langchain.callbacks.base import BaseCallbackHandler
-import io
-import sys
+from pydantic import BaseModel, Field
+from typing import List
+import time
 load_dotenv()
 
-groq_api_key_5= os.getenv("GROQ_API_KEY_6")
-
-# Custom callback handler to capture agent's thought process
-class CaptureStdoutCallbackHandler(BaseCallbackHandler):
-    def __init__(self):
-        self.thought_process = io.StringIO()
-        self.stdout_backup = sys.stdout
-        
-    def start_capturing(self):
-        sys.stdout = self.thought_process
-        
-    def stop_capturing(self):
-        sys.stdout = self.stdout_backup
-        
-    def get_output(self):
-        return self.thought_process.getvalue()
-
-def chat_db(db_name, host, user, password, database, query):
-    if db_name == "postgresql":
-        try:
-            llm = ChatGroq(
-                groq_api_key=groq_api_key_5,
-                model_name="llama-3.3-70b-versatile",
-                streaming=False
-            )
-
-            db, engine = configure_db(db_name, host, user, password, database)
-
-            # Setup to capture agent's thought process
-            capture_handler = CaptureStdoutCallbackHandler()
-            capture_handler.start_capturing()
-            
-            toolkit = SQLDatabaseToolkit(db=db, llm=llm)
-            agent = create_sql_agent(
-                llm=llm,
-                toolkit=toolkit,
-                verbose=True,
-                agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-            )
-
-            sql_generation_prompt = f"""
+STREAM_BATCH_ROWS = int(os.getenv("CHAT_STREAM_BATCH_ROWS", "200"))
+CURSOR_BATCH_ROWS = int(os.getenv("CHAT_CURSOR_BATCH_ROWS", "1000"))
+MAX_RESULT_ROWS = int(os.getenv("CHAT_MAX_RESULT_ROWS", "10000"))
+MAX_RESULT_BYTES = int(os.getenv("CHAT_MAX_RESULT_BYTES", str(8 * 1024 * 1024)))
+# Larger results are re-run on a cache hit instead of being stored
+QUERY_CACHE_MAX_RESULT_ROWS = int(os.getenv("QUERY_CACHE_MAX_RESULT_ROWS", "1000"))
+
+NO_ROWS_MESSAGE = "Query executed successfully. No rows returned."
+
+
+def _emit(on_event, event, **payload):
+    if on_event is not None:
+        on_event(event, payload)
+
+def generate_sql(llm, db, engine, dialect, query, on_event=None, table_hint=None):
+    toolkit = SQLDatabaseToolkit(db=db, llm=llm)
+    agent = create_sql_agent(
+        llm=llm,
+        toolkit=toolkit,
+        verbose=False,
+        agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+    )
+
+    sql_generation_prompt = f"""
             For the following question, generate a valid SQL query to answer it.
             Question: "{query}"
 
-            You must return a valid SQL query that would run in PostgreSQL.
+            You must return a valid SQL query that would run in {dialect.label}. {dialect.prompt_hint}
             The query should only start with SELECT means only read operation.
             If you Cannot find the answer, return "I don't know".
             DO NOT include explanations, markdown formatting, or anything else - ONLY the SQL query itself.
             """
+    if table_hint:
+        sql_generation_prompt += f"""
+            The tables most likely to be relevant are: {', '.join(table_hint)}. Start by inspecting their schema.
+            """
 
-            # Run the agent once and capture all output
-            agent_response = agent.run(sql_generation_prompt)
-            
-            # Capture output and restore stdout
-            thought_process = capture_handler.get_output()
-            capture_handler.stop_capturing()
-
-            # Process the result
-            try:
-                sql_query = extract_sql_query(agent_response)
-                if not is_valid_sql(sql_query):
-                    raise ValueError(f"The generated query doesn't appear to be valid SQL: {sql_query}")
-            except ValueError as e:
-              
-                sql_query = extract_sql_query(agent_response)
-                if not is_valid_sql(sql_query):
-                    raise ValueError(f"Failed to generate valid SQL: {sql_query}")
-
-            sql_result_list = []
-            with engine.connect() as connection:
-                result = connection.execute(text(sql_query))
-                if result.returns_rows:
-                    columns = result.keys()
-                    for row in result:
-                        row_dict = {col: value for col, value in zip(columns, row)}
-                        for key, value in row_dict.items():
-                            if not isinstance(value, (str, int, float, bool, type(None))):
-                                row_dict[key] = str(value)
-                        sql_result_list.append(row_dict)
-                    sql_result_str = json.dumps(sql_result_list)
-                else:
-                    sql_result_str = "Query executed successfully. No rows returned."
-
-            summary_prompt = f"""
-            Question: {query}
-            SQL Query: {sql_query}
-            SQL Result: {sql_result_str}
+    # Agent steps are recorded (and streamed to on_event) by the request's trace collector
+    agent_response = agent.run(sql_generation_prompt)
+    trace = current_trace()
+    thought_process = trace.agent_transcript() if trace is not None else ""
 
-            Please provide a clear, concise summary of these results in natural language.
-            """
+    # Parsed and checked against the cached schema before anything reaches the database
+    sql_query = validate_sql(extract_sql_query(agent_response, dialect.name), dialect.name, get_database_schema(engine))
 
-            summary = llm.invoke(summary_prompt).content
+    _emit(on_event, "sql", sql_query=sql_query)
+    return sql_query, thought_process
 
-            # Add this: generate a short 5–8 word overview
-            overview_prompt = f"""
-            Question: {query}
-            SQL Query: {sql_query}
-            SQL Result: {sql_result_str}
+class GeneratedSQL(BaseModel):
+    sql: str = Field(description="One read-only SELECT statement answering the question, or an empty string if it cannot be answered from the schema")
+    tables: List[str] = Field(default_factory=list, description="Tables referenced by the query")
 
-            Please provide a title of these results in 5 to 8 words.
-            """
-            title = llm.invoke(overview_prompt).content
+def format_schema(tables, table_names):
+    lines = []
+    for table in table_names:
+        info = tables[table]
+        columns = ", ".join(
+            f"{col['name']} {col['type']}" + (" PK" if col["name"] in info["primary_key"] else "")
+            for col in info["columns"]
+        )
+        lines.append(f"{table}({columns})")
+        for fk in info["foreign_keys"]:
+            lines.append(f"  {table}.{', '.join(fk['columns'])} -> {fk['referred_table']}.{', '.join(fk['referred_columns'])}")
+    return "\n".join(lines)
 
-            return {
-                "user_query": query,
-                "sql_query": sql_query,
-                "sql_result": sql_result_list if result.returns_rows else "Query executed successfully. No rows returned.",
-                "summary": summary,
-                "title": title,                      # new field
-                "agent_thought_process": thought_process
-            }
+def generate_sql_fast(llm, engine, dialect, query, on_event=None):
+    """Single structured LLM call grounded on the cached schema, instead of the multi-step agent."""
+    tables = get_schema_details(engine)
+    relevant = relevant_tables(engine, query)
+
+    prompt = f"""
+            You are an expert {dialect.label} analyst. Using only the tables below, write one SQL query that answers the question.
+
+            Schema:
+            {format_schema(tables, relevant)}
 
-        except Exception as e:
-            import traceback
-            error_details = traceback.format_exc()
-            raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}\n{error_details}")
-    elif db_name=="mysql":
-        try:
-            llm = ChatGroq(
-                groq_api_key=groq_api_key_5,
-                model_name="llama-3.3-70b-versatile",
-                streaming=False
-            )
-            
-            capture_handler = CaptureStdoutCallbackHandler()
-            capture_handler.start_capturing()
-
-            db, engine = configure_db(db_name, host, user, password, database)
-            
-            toolkit = SQLDatabaseToolkit(db=db, llm=llm)
-            agent = create_sql_agent(
-                llm=llm,
-                toolkit=toolkit,
-                verbose=True,
-                agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION
-            )
-            
-            sql_generation_prompt = f"""
-            For the following question, generate a valid SQL query to answer it.
             Question: "{query}"
-            
-            You must return a valid SQL query that would run in MySQL.
-            The query should only start with SELECT means only read operation.
-            If you Cannot find the answer, return "I don't know".
-            DO NOT include explanations, markdown formatting, or anything else - ONLY the SQL query itself.
+
+            The query must be a single read-only SELECT statement valid in {dialect.label}. {dialect.prompt_hint}
+            If the question cannot be answered from this schema, return an empty sql string.
             """
-            
-            
-            agent_response = agent.run(sql_generation_prompt)
-           
-            thought_process = capture_handler.get_output()
-            capture_handler.stop_capturing()
-            
-            try:
-                sql_query = extract_sql_query(agent_response)
-                if not is_valid_sql(sql_query):
-                    raise ValueError(f"The generated query doesn't appear to be valid SQL: {sql_query}")
-            except ValueError as e:
-                
-                sql_query = extract_sql_query(agent_response)
-                if not is_valid_sql(sql_query):
-                    raise ValueError(f"Failed to generate valid SQL: {sql_query}")
-        
-            sql_result_list = []
-            with engine.connect() as connection:
-                result = connection.execute(text(sql_query))
-                if result.returns_rows:
-                    columns = result.keys()
-                    for row in result:
-                        row_dict = {col: value for col, value in zip(columns, row)}
-                        for key, value in row_dict.items():
-                            if not isinstance(value, (str, int, float, bool, type(None))):
-                                row_dict[key] = str(value)
-                        sql_result_list.append(row_dict)
-                    sql_result_str = json.dumps(sql_result_list)
-                else:
-                    sql_result_str = "Query executed successfully. No rows returned."
-            
-            summary_prompt = f"""
+
+    answer = llm.with_structured_output(GeneratedSQL).invoke(prompt)
+    if not answer.sql.strip():
+        raise ValueError("Fast generation could not answer the question from the schema")
+    sql_query = validate_sql(answer.sql, dialect.name, get_database_schema(engine))
+
+    _emit(on_event, "sql", sql_query=sql_query)
+    thought_process = f"Generated in a single call from tables: {', '.join(relevant)}"
+    return sql_query, thought_process
+
+def generate_sql_for_mode(llm, db, engine, dialect, query, generation_mode="agent", on_event=None):
+    """Returns (sql_query, thought_process, mode used); fast mode falls back to the agent on any failure."""
+    if generation_mode == "fast":
+        try:
+            with stage("generate_sql_fast"):
+                sql_query, thought_process = generate_sql_fast(llm, engine, dialect, query, on_event)
+            return sql_query, thought_process, "fast"
+        except Exception as e:
+            print(f"[Warning] Fast SQL generation failed, falling back to agent: {e}")
+            _emit(on_event, "fallback", reason=str(e))
+
+    # Point the agent at the likely tables so it does not need to read the whole schema
+    try:
+        table_hint = relevant_tables(engine, query)
+        if len(table_hint) == len(db.get_usable_table_names()):
+            table_hint = None
+    except Exception as e:
+        print(f"[Warning] Could not rank tables for the agent: {e}")
+        table_hint = None
+
+    with stage("generate_sql_agent"):
+        sql_query, thought_process = generate_sql(llm, db, engine, dialect, query, on_event, table_hint)
+    return sql_query, thought_process, "agent"
+
+def _emit_rows(on_event, columns, records, result_format):
+    if on_event is None:
+        return
+    for start in range(0, len(records), STREAM_BATCH_ROWS):
+        _emit(on_event, "rows", rows=format_result(columns, records[start:start + STREAM_BATCH_ROWS], result_format))
+
+def execute_sql(engine, sql_query, on_event=None, result_format="rows"):
+    """Run the query through a server-side cursor, stopping at the row/byte caps.
+
+    Returns (columns, records, truncated) where records are plain tuples; records is None
+    for statements without a result set.
+    """
+    original_query = sql_query.strip().rstrip(";").strip()
+    records = []
+    result_bytes = 0
+    truncated = False
+    with engine.connect() as connection:
+        # One row over the cap so truncation is still detected when the guard adds a LIMIT
+        sql_query = guard_query(connection, sql_query, MAX_RESULT_ROWS + 1)
+        if sql_query != original_query:
+            _emit(on_event, "guard", action="limited", sql_query=sql_query)
+
+        with stage("execute_sql"), running_query(engine, connection):
+            connection = connection.execution_options(stream_results=True, yield_per=CURSOR_BATCH_ROWS)
+            result = connection.execute(text(sql_query))
+            if not result.returns_rows:
+                return None, None, False
+
+            columns = list(result.keys())
+            _emit(on_event, "columns", columns=columns)
+            for partition in result.partitions():
+                batch = [tuple(row) for row in partition]
+                for index, record in enumerate(batch):
+                    result_bytes += len(dumps(record))
+                    if len(records) + index >= MAX_RESULT_ROWS or result_bytes > MAX_RESULT_BYTES:
+                        batch = batch[:index]
+                        truncated = True
+                        break
+                records.extend(batch)
+                _emit_rows(on_event, columns, batch, result_format)
+                if truncated:
+                    break
+            result.close()
+
+    record_query_result(len(records), result_bytes)
+    if truncated:
+        _emit(on_event, "truncated", row_count=len(records))
+    return columns, records, truncated
+
+def _summary_prompt(query, sql_query, sql_result_str):
+    return f"""
             Question: {query}
             SQL Query: {sql_query}
             SQL Result: {sql_result_str}
-            
+
             Please provide a clear, concise summary of these results in natural language.
             """
-            
-            summary = llm.invoke(summary_prompt).content
 
-            # Add this: generate a short 5–8 word overview
-            overview_prompt = f"""
+def _title_prompt(query, sql_query, sql_result_str):
+    return f"""
             Question: {query}
             SQL Query: {sql_query}
             SQL Result: {sql_result_str}
 
-            Please provide a brief overview of these results in 5 to 8 words.
+            Please provide a title of these results in 5 to 8 words.
             """
-            title = llm.invoke(overview_prompt).content
-            
-            return {
-                "user_query": query,
-                "sql_query": sql_query,
-                "sql_result": sql_result_list if result.returns_rows else "Query executed successfully. No rows returned.",
-                "summary": summary,
-                "title": title,                      # new field
-                "agent_thought_process": thought_process  # Include the thought process
-            }
-            
-        except Exception as e:
-            import traceback
-            error_details = traceback.format_exc()
-            raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}\n{error_details}")
\ No newline at end of file
+
+def summarize_result(llm, query, sql_query, sql_result_str, include_summary=True, include_title=True, on_event=None):
+    if on_event is not None and include_summary:
+        # Stream summary tokens as they arrive while the title is generated alongside
+        title_future = None
+        if include_title:
+            title_future = submit_title(chat_model("title").invoke, _title_prompt(query, sql_query, sql_result_str))
+        chunks = []
+        for chunk in llm.stream(_summary_prompt(query, sql_query, sql_result_str)):
+            chunks.append(chunk.content)
+            _emit(on_event, "summary_token", token=chunk.content)
+        summary = "".join(chunks)
+        _emit(on_event, "summary", summary=summary)
+        title = title_future.result().content if title_future is not None else None
+        if title is not None:
+            _emit(on_event, "title", title=title)
+        return summary, title
+
+    # The title goes to the small model, in parallel with the summary
+    title_future = None
+    if include_title:
+        title_future = submit_title(chat_model("title").invoke, _title_prompt(query, sql_query, sql_result_str))
+    summary = llm.invoke(_summary_prompt(query, sql_query, sql_result_str)).content if include_summary else None
+    title = title_future.result().content if title_future is not None else None
+    if summary is not None:
+        _emit(on_event, "summary", summary=summary)
+    if title is not None:
+        _emit(on_event, "title", title=title)
+    return summary, title
+
+def _build_response(query, sql_query, columns, records, truncated, generation_mode, summary, title, thought_process, result_format, cache_tier):
+    trace = current_trace()
+    return {
+        "user_query": query,
+        "sql_query": sql_query,
+        "sql_result": format_result(columns, records, result_format) if records is not None else NO_ROWS_MESSAGE,
+        "truncated": truncated,
+        "generation_mode": generation_mode,
+        "cache": cache_tier,
+        "summary": summary,
+        "title": title,
+        "agent_thought_process": thought_process,
+        "agent_trace": {"steps": trace.steps, "dropped_steps": trace.dropped_steps} if trace is not None else None
+    }
+
+def answer_query(llm, db, engine, dialect, query, include_summary=True, include_title=True, on_event=None, result_format="rows", generation_mode="agent"):
+    """generate -> execute -> summarize, short-circuited by the NL->SQL cache."""
+    with trace_scope(on_event):
+        return _answer_query(llm, db, engine, dialect, query, include_summary, include_title, on_event, result_format, generation_mode)
+
+def _answer_query(llm, db, engine, dialect, query, include_summary, include_title, on_event, result_format, generation_mode):
+    identity = schema_identity(engine)
+    fingerprint = get_cached_fingerprint(engine)
+    cached, cache_tier = query_cache.lookup(identity, fingerprint, query)
+
+    if cached is not None:
+        _emit(on_event, "cache_hit", tier=cache_tier)
+        sql_query = cached["sql_query"]
+        thought_process = cached["agent_thought_process"]
+        generation_mode = cached["generation_mode"]
+        generation_seconds = cached["generation_seconds"]
+        _emit(on_event, "sql", sql_query=sql_query)
+
+        # Stored results are only reused for the exact same question and while they are fresh
+        stored = cached.get("result")
+        if (cache_tier == "exact" and stored is not None and stored["expires_at"] > time.time()
+                and (stored["summary"] is not None or not include_summary)
+                and (stored["title"] is not None or not include_title)):
+            columns, records = stored["columns"], [tuple(record) for record in stored["records"]]
+            summary = stored["summary"] if include_summary else None
+            title = stored["title"] if include_title else None
+            _emit(on_event, "columns", columns=columns)
+            _emit_rows(on_event, columns, records, result_format)
+            if summary is not None:
+                _emit(on_event, "summary", summary=summary)
+            if title is not None:
+                _emit(on_event, "title", title=title)
+            return _build_response(query, sql_query, columns, records, False, generation_mode, summary, title, thought_process, result_format, cache_tier)
+    else:
+        started = time.perf_counter()
+        sql_query, thought_process, generation_mode = generate_sql_for_mode(llm, db, engine, dialect, query, generation_mode, on_event)
+        generation_seconds = time.perf_counter() - started
+
+    check_cancelled()
+    columns, records, truncated = execute_sql(engine, sql_query, on_event, result_format)
+    with stage("describe_result"):
+        sql_result_str = describe_result(columns, records, truncated) if records is not None else NO_ROWS_MESSAGE
+    check_cancelled()
+    with stage("summarize"):
+        summary, title = summarize_result(llm, query, sql_query, sql_result_str, include_summary, include_title, on_event)
+
+    entry = {
+        "sql_query": sql_query,
+        "generation_mode": generation_mode,
+        "agent_thought_process": thought_process,
+        "generation_seconds": generation_seconds,
+    }
+    if QUERY_CACHE_RESULT_TTL and records is not None and not truncated and len(records) <= QUERY_CACHE_MAX_RESULT_ROWS:
+        entry["result"] = {
+            "columns": columns,
+            "records": records,
+            "summary": summary,
+            "title": title,
+            "expires_at": time.time() + QUERY_CACHE_RESULT_TTL,
+        }
+    query_cache.store(identity, fingerprint, query, entry)
+    completion_indexes.record_question(engine, query)
+
+    return _build_response(query, sql_query, columns, records, truncated, generation_mode, summary, title, thought_process, result_format, cache_tier)
+
+def chat_db(db_name, host, user, password, database, query, include_summary=True, include_title=True, on_event=None, result_format="rows", generation_mode="agent"):
+    """Answer a natural language question against the database.
+
+    When on_event is given it is called as on_event(event, payload) for each pipeline stage:
+    agent thought/observation steps, the final sql, result columns and row batches, summary tokens and the title.
+    """
+    dialect = get_dialect(db_name)
+    try:
+        llm = chat_model()
+        db, engine = configure_db(db_name, host, user, password, database)
+
+        return answer_query(llm, db, engine, dialect, query, include_summary, include_title, on_event, result_format, generation_mode)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        error_details = traceback.format_exc()
+        raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}\n{error_details}")
@@ -0,0 +1,232 @@
+import os
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import deque
+from sqlalchemy import text
+from utils.db import get_cached_fingerprint, get_schema_details, on_schema_loaded, schema_identity
+from utils.executor import submit_to_resource
+from utils.guard import running_query
+
+COMPLETION_SAMPLE_COLUMNS = int(os.getenv("COMPLETION_SAMPLE_COLUMNS", "40"))
+COMPLETION_SAMPLE_VALUES = int(os.getenv("COMPLETION_SAMPLE_VALUES", "25"))
+# Rows read per sampled column; the distinct values come from this prefix of the table
+COMPLETION_SAMPLE_ROWS = int(os.getenv("COMPLETION_SAMPLE_ROWS", "10000"))
+COMPLETION_SAMPLE_WORKERS = int(os.getenv("COMPLETION_SAMPLE_WORKERS", "2"))
+COMPLETION_MAX_QUESTIONS = int(os.getenv("COMPLETION_MAX_QUESTIONS", "500"))
+COMPLETION_INDEX_CHECK_INTERVAL = float(os.getenv("COMPLETION_INDEX_CHECK_INTERVAL", "300"))
+
+SQL_KEYWORDS = [
+    "SELECT", "FROM", "WHERE", "GROUP BY", "ORDER BY", "HAVING", "LIMIT", "JOIN", "LEFT JOIN",
+    "INNER JOIN", "DISTINCT", "COUNT", "SUM", "AVG", "MIN", "MAX", "BETWEEN", "LIKE", "IN",
+    "AS", "ASC", "DESC", "UNION", "WITH", "CASE WHEN",
+]
+QUERY_PHRASES = [
+    "show all", "how many", "top 10", "top 5", "average", "total", "count of", "list all",
+    "which has the most", "compare", "trend over time", "breakdown by", "distinct values of",
+]
+
+# Ranking weights by term source
+WEIGHTS = {"question": 6, "table": 5, "column": 4, "suggestion": 3, "value": 2, "phrase": 2, "keyword": 1}
+
+
+class PrefixIndex:
+    """Sorted (key, -weight, term) entries searched with bisect.
+
+    Every word start of a term is indexed, so "bats" finds "top 5 batsmen by runs" as well as
+    "batsman". Lookups are O(log n + matches) and need no database or LLM round-trip.
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._terms = set()
+        self._lock = threading.Lock()
+
+    def add(self, term, source):
+        term = str(term).strip()
+        if not term or len(term) > 200:
+            return
+        weight = WEIGHTS[source]
+        lowered = term.lower()
+        with self._lock:
+            if lowered in self._terms:
+                return
+            self._terms.add(lowered)
+            for match in re.finditer(r"(?:^|(?<=[\s_.]))\w", lowered):
+                insort(self._entries, (lowered[match.start():], -weight, term))
+
+    def search(self, prefix, limit, anchored=False):
+        """Best terms containing a word starting with prefix; anchored=True only matches from the term's start."""
+        prefix = prefix.lower()
+        matches = {}
+        with self._lock:
+            position = bisect_left(self._entries, (prefix,))
+            while position < len(self._entries) and len(matches) < limit * 10:
+                key, negative_weight, term = self._entries[position]
+                if not key.startswith(prefix):
+                    break
+                position += 1
+                if anchored and key != term.lower():
+                    continue
+                # A match at the start of the term outranks one in the middle
+                score = -negative_weight + (0.5 if term.lower().startswith(prefix) else 0)
+                matches[term] = max(score, matches.get(term, 0))
+        return sorted(matches, key=lambda term: (-matches[term], len(term), term))[:limit]
+
+    def __len__(self):
+        return len(self._terms)
+
+
+def _text_column(column_type):
+    column_type = column_type.lower()
+    return any(name in column_type for name in ("char", "text", "string", "enum"))
+
+
+def build_completion_index(engine, questions=()):
+    index = PrefixIndex()
+    for keyword in SQL_KEYWORDS:
+        index.add(keyword, "keyword")
+    for phrase in QUERY_PHRASES:
+        index.add(phrase, "phrase")
+    for table, info in get_schema_details(engine).items():
+        index.add(table, "table")
+        for col in info["columns"]:
+            index.add(col["name"], "column")
+    for question in questions:
+        index.add(question, "question")
+    return index
+
+
+def sample_column_values(engine, tables):
+    """A few distinct values of the first text columns, e.g. team or player names; blocking.
+
+    Each column is read from a bounded subquery, so a huge table costs COMPLETION_SAMPLE_ROWS
+    rows rather than a full DISTINCT scan, and every query runs under the guard's timeout.
+    """
+    quote = engine.dialect.identifier_preparer.quote
+    columns = [
+        (table, col["name"])
+        for table, info in tables.items()
+        for col in info["columns"]
+        if _text_column(col["type"])
+    ][:COMPLETION_SAMPLE_COLUMNS]
+    values = []
+    with engine.connect() as connection:
+        for table, column in columns:
+            try:
+                with running_query(engine, connection):
+                    rows = connection.execute(text(
+                        f"SELECT DISTINCT sampled_value FROM ("
+                        f"SELECT {quote(column)} AS sampled_value FROM {quote(table)} "
+                        f"WHERE {quote(column)} IS NOT NULL LIMIT {COMPLETION_SAMPLE_ROWS}"
+                        f") AS sampled LIMIT {COMPLETION_SAMPLE_VALUES}"
+                    )).fetchall()
+                values += [value for (value,) in rows]
+            except Exception as e:
+                print(f"[Warning] Could not sample {table}.{column} for completions: {e}")
+                connection.rollback()
+    return values
+
+
+class CompletionIndexes:
+    """Per-database prefix indexes plus the questions that have already been answered successfully."""
+
+    def __init__(self):
+        self._entries = {}
+        self._questions = {}
+        # identity -> {"fingerprint", "values"}, sampled once per schema load
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def get(self, engine):
+        """(index, needs_refresh) for the database, or (None, True) if no index was built yet."""
+        with self._lock:
+            entry = self._entries.get(schema_identity(engine))
+        if entry is None:
+            return None, True
+        return entry["index"], time.monotonic() - entry["checked_at"] > COMPLETION_INDEX_CHECK_INTERVAL
+
+    def build(self, engine):
+        """Build (or rebuild after a schema change) the index for the database; blocking.
+
+        Column values come from the latest sample of this schema version, if one has finished.
+        """
+        identity = schema_identity(engine)
+        fingerprint = get_cached_fingerprint(engine)
+        with self._lock:
+            entry = self._entries.get(identity)
+            if entry is not None and entry["fingerprint"] == fingerprint:
+                entry["checked_at"] = time.monotonic()
+                return entry["index"]
+            questions = list(self._questions.get(identity, ()))
+
+        index = build_completion_index(engine, questions)
+        with self._lock:
+            self._entries[identity] = {"index": index, "fingerprint": fingerprint, "checked_at": time.monotonic()}
+            sample = self._samples.get(identity)
+        if sample is not None and sample["fingerprint"] == fingerprint:
+            for value in sample["values"]:
+                index.add(value, "value")
+        return index
+
+    def sample(self, engine, tables, fingerprint):
+        """Sample column values for a freshly loaded schema and add them to the live index; blocking."""
+        values = sample_column_values(engine, tables)
+        identity = schema_identity(engine)
+        with self._lock:
+            self._samples[identity] = {"fingerprint": fingerprint, "values": values}
+            entry = self._entries.get(identity)
+        if entry is not None and entry["fingerprint"] == fingerprint:
+            for value in values:
+                entry["index"].add(value, "value")
+
+    def record_question(self, engine, question):
+        identity = schema_identity(engine)
+        with self._lock:
+            questions = self._questions.setdefault(identity, deque(maxlen=COMPLETION_MAX_QUESTIONS))
+            questions.append(question)
+            entry = self._entries.get(identity)
+        if entry is not None:
+            entry["index"].add(question, "question")
+
+    def add_suggestions(self, engine, suggestions):
+        index, _ = self.get(engine)
+        if index is not None:
+            for suggestion in suggestions:
+                index.add(suggestion, "suggestion")
+
+
+completion_indexes = CompletionIndexes()
+# Values are sampled in the background whenever a schema is loaded or refreshed, never per typeahead request
+on_schema_loaded(lambda engine, tables, fingerprint: submit_to_resource(
+    "completion-sample", COMPLETION_SAMPLE_WORKERS, completion_indexes.sample, engine, tables, fingerprint
+))
+
+# Used when no database is given
+_keyword_index = PrefixIndex()
+for _keyword in SQL_KEYWORDS:
+    _keyword_index.add(_keyword, "keyword")
+for _phrase in QUERY_PHRASES:
+    _keyword_index.add(_phrase, "phrase")
+
+
+def complete(index, term, limit):
+    """Completions for the typed text: whole-text matches first, then the last word completed in place."""
+    index = index or _keyword_index
+    typed = term.strip()
+    if not typed:
+        return []
+
+    completions = index.search(typed, limit)
+    head, _, last = typed.rpartition(" ")
+    if head and last and len(completions) < limit:
+        completions += [f"{head} {match}" for match in index.search(last, limit, anchored=True)]
+
+    seen = set()
+    unique = []
+    for completion in completions:
+        if completion.lower() not in seen:
+            seen.add(completion.lower())
+            unique.append(completion)
+    return unique[:limit]
@@ -1,71 +1,292 @@
-import re
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
 from fastapi import HTTPException
-from sqlalchemy import create_engine, inspect
+from sqlalchemy import create_engine, event, inspect, text
 from langchain_community.utilities import SQLDatabase
+from utils.dialects import get_dialect
+from utils.metrics import record_cache, stage
+
+
+DB_ENGINE_CACHE_SIZE = int(os.getenv("DB_ENGINE_CACHE_SIZE", "32"))
+DB_ENGINE_IDLE_TTL = float(os.getenv("DB_ENGINE_IDLE_TTL", "900"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# Process-wide registry of (SQLDatabase, engine) pairs, most recently used last.
+_engine_registry = OrderedDict()
+_engine_registry_lock = threading.Lock()
+
+
+def connection_key(db_name, host, user, password, database):
+    """Identity of a tenant database; the password only enters as a hash."""
+    credential_hash = hashlib.sha256(password.encode("utf-8")).hexdigest()
+    return (db_name, host, user, database, credential_hash)
+
+
+def _create_engine(db_name, host, user, password, database):
+    dialect = get_dialect(db_name)
+    database = dialect.resolve_database(database)
+    pool_options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    engine = create_engine(dialect.url(host, user, password, database), **dialect.engine_options(database), **pool_options)
+    event.listen(engine, "connect", lambda dbapi_connection, connection_record: dialect.on_connect(dbapi_connection, database))
+    return engine
+
+
+def _evict_engines(now):
+    """Drop idle and least recently used entries. Caller must hold the registry lock."""
+    evicted = []
+    for key, entry in list(_engine_registry.items()):
+        if now - entry["last_used"] > DB_ENGINE_IDLE_TTL:
+            evicted.append(_engine_registry.pop(key))
+    while len(_engine_registry) > DB_ENGINE_CACHE_SIZE:
+        evicted.append(_engine_registry.popitem(last=False)[1])
+    return evicted
 
 
 def configure_db(db_name, host, user, password, database):
-    if db_name == "mysql": 
+    key = connection_key(db_name, host, user, password, database)
+    now = time.monotonic()
+
+    with _engine_registry_lock:
+        entry = _engine_registry.get(key)
+        if entry is not None:
+            entry["last_used"] = now
+            _engine_registry.move_to_end(key)
+            record_cache("engine", True)
+            return entry["db"], entry["engine"]
+
+    record_cache("engine", False)
+    try:
+        with stage("configure_db"):
+            engine = _create_engine(db_name, host, user, password, database)
+            db = SQLDatabase(engine, view_support=get_dialect(db_name).view_support)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Database connection error: {str(e)}")
+
+    with _engine_registry_lock:
+        entry = _engine_registry.get(key)
+        if entry is not None:
+            # Another request built the same engine meanwhile; keep the registered one.
+            evicted = [{"engine": engine}]
+        else:
+            entry = {"db": db, "engine": engine, "last_used": now}
+            _engine_registry[key] = entry
+            evicted = _evict_engines(now)
+        entry["last_used"] = now
+        _engine_registry.move_to_end(key)
+
+    for stale in evicted:
+        stale["engine"].dispose()
+    _forget_evicted(evicted)
+
+    return entry["db"], entry["engine"]
+
+
+def _forget_evicted(evicted):
+    """Invalidate the schemas of evicted engines that no registered engine still points at."""
+    with _engine_registry_lock:
+        live = {schema_identity(entry["engine"]) for entry in _engine_registry.values()}
+    for identity in {schema_identity(stale["engine"]) for stale in evicted} - live:
+        invalidate_schema(identity)
+
+
+def pool_label(engine):
+    """Short opaque label for metrics: the identity holds the driver, user, host and database name."""
+    return hashlib.sha256(schema_identity(engine).encode("utf-8")).hexdigest()[:12]
+
+
+def get_pooled_engine(db_name, host, user, password, database):
+    """(SQLDatabase, engine) if the registry already holds this database, else None; never connects."""
+    key = connection_key(db_name, host, user, password, database)
+    with _engine_registry_lock:
+        entry = _engine_registry.get(key)
+        if entry is None:
+            return None
+        entry["last_used"] = time.monotonic()
+        _engine_registry.move_to_end(key)
+        return entry["db"], entry["engine"]
+
+
+def pool_status():
+    """Pool utilisation of every registered engine, keyed by pool_label.
+
+    Evicted engines drop out of the registry, so the label set stays within DB_ENGINE_CACHE_SIZE.
+    """
+    with _engine_registry_lock:
+        engines = [entry["engine"] for entry in _engine_registry.values()]
+    status = {}
+    for engine in engines:
+        pool = engine.pool
+        if not hasattr(pool, "checkedout"):
+            continue
+        status[pool_label(engine)] = {"size": pool.size(), "checked_out": pool.checkedout(), "overflow": max(pool.overflow(), 0)}
+    return status
+
+
+def dispose_engines():
+    """Dispose every pooled engine, e.g. on application shutdown."""
+    with _engine_registry_lock:
+        entries = list(_engine_registry.values())
+        _engine_registry.clear()
+    for entry in entries:
+        entry["engine"].dispose()
+
+SCHEMA_CHECK_INTERVAL = float(os.getenv("SCHEMA_CHECK_INTERVAL", "60"))
+
+_schema_cache = {}
+_schema_cache_lock = threading.Lock()
+# listener(identity), run when a database's schema and anything derived from it should be dropped
+_invalidation_listeners = []
+# listener(engine, tables, fingerprint), run after every schema (re)load, e.g. to sample column values
+_schema_listeners = []
+
+
+def schema_identity(engine):
+    """Stable, password-free identity of the database behind an engine."""
+    return engine.url.render_as_string(hide_password=True)
+
+
+def _inspect_schema(engine):
+    """Per-table reflection for dialects without a bulk catalog query."""
+    inspector = inspect(engine)
+    tables = {}
+    for table in inspector.get_table_names():
+        tables[table] = {
+            "columns": [
+                {"name": col["name"], "type": str(col["type"]), "nullable": col.get("nullable", True), "comment": col.get("comment")}
+                for col in inspector.get_columns(table)
+            ],
+            "primary_key": inspector.get_pk_constraint(table).get("constrained_columns", []),
+            "foreign_keys": [
+                {"columns": fk["constrained_columns"], "referred_table": fk["referred_table"], "referred_columns": fk["referred_columns"]}
+                for fk in inspector.get_foreign_keys(table)
+            ],
+        }
+    return tables
+
+
+def _load_schema(engine):
+    dialect = get_dialect(engine.dialect.name)
+    if dialect.columns_sql is None:
+        return _inspect_schema(engine)
+
+    tables = {}
+    with engine.connect() as connection:
+        for table, column, data_type, is_nullable, comment in connection.execute(text(dialect.columns_sql)):
+            entry = tables.setdefault(table, {"columns": [], "primary_key": [], "foreign_keys": []})
+            entry["columns"].append({"name": column, "type": data_type, "nullable": is_nullable == "YES", "comment": comment or None})
+
+        foreign_keys = {}
+        for table, column, constraint_type, referred_table, referred_column in connection.execute(text(dialect.constraints_sql)):
+            if table not in tables:
+                continue
+            if constraint_type == "PRIMARY KEY":
+                if column not in tables[table]["primary_key"]:
+                    tables[table]["primary_key"].append(column)
+            elif referred_table:
+                fk = foreign_keys.setdefault((table, referred_table), {"columns": [], "referred_table": referred_table, "referred_columns": []})
+                if column not in fk["columns"]:
+                    fk["columns"].append(column)
+                if referred_column not in fk["referred_columns"]:
+                    fk["referred_columns"].append(referred_column)
+
+    for (table, _), fk in foreign_keys.items():
+        tables[table]["foreign_keys"].append(fk)
+    return tables
+
+
+def get_schema_fingerprint(engine, tables=None):
+    dialect = get_dialect(engine.dialect.name)
+    if dialect.fingerprint_sql is not None:
+        with stage("schema_fingerprint"), engine.connect() as connection:
+            return str(connection.execute(text(dialect.fingerprint_sql)).scalar())
+    if tables is None:
+        tables = _inspect_schema(engine)
+    digest = hashlib.md5()
+    for table in sorted(tables):
+        for col in tables[table]["columns"]:
+            digest.update(f"{table}.{col['name']}:{col['type']}:{col['nullable']},".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_schema_details(engine, refresh=False):
+    """Cached tables -> {columns, primary_key, foreign_keys}, reloaded only when the catalog fingerprint changes."""
+    key = schema_identity(engine)
+    now = time.monotonic()
+    with _schema_cache_lock:
+        entry = _schema_cache.get(key)
+
+    if entry is not None and not refresh:
+        if now - entry["checked_at"] < SCHEMA_CHECK_INTERVAL:
+            record_cache("schema", True)
+            return entry["tables"]
+        fingerprint = get_schema_fingerprint(engine) if get_dialect(engine.dialect.name).fingerprint_sql is not None else None
+        if fingerprint is not None and fingerprint == entry["fingerprint"]:
+            entry["checked_at"] = now
+            record_cache("schema", True)
+            return entry["tables"]
+
+    record_cache("schema", False)
+    with stage("schema_load"):
+        tables = _load_schema(engine)
+    entry = {"tables": tables, "fingerprint": get_schema_fingerprint(engine, tables), "checked_at": now}
+    with _schema_cache_lock:
+        _schema_cache[key] = entry
+    for listener in _schema_listeners:
         try:
-            conn_string = f"mysql+mysqlconnector://{user}:{password}@{host}/{database}"
-            engine = create_engine(conn_string)
-            return SQLDatabase(engine), engine
+            listener(engine, tables, entry["fingerprint"])
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Database connection error: {str(e)}")
-    elif db_name == "postgresql":
+            print(f"[Warning] Schema listener failed: {e}")
+    return tables
+
+
+def on_schema_invalidated(listener):
+    """Register listener(identity), e.g. to delete indexes built from that database's schema."""
+    _invalidation_listeners.append(listener)
+
+
+def invalidate_schema(identity):
+    """Forget the cached schema of a database, on an admin refresh or when its engine is evicted."""
+    with _schema_cache_lock:
+        _schema_cache.pop(identity, None)
+    for listener in _invalidation_listeners:
         try:
-            conn_string = f"postgresql+psycopg2://{user}:{password}@{host}/{database}"
-            engine = create_engine(conn_string, connect_args={"options": "-c default_transaction_read_only=on"})
-            return SQLDatabase(engine), engine
+            listener(identity)
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Database connection error: {str(e)}")  
-        
-    else:
-        raise HTTPException(status_code=400, detail=f"Unsupported database type: {db_name}. Choose 'mysql' or 'postgresql'.")
-    
-def get_database_schema(engine):
-    inspector = inspect(engine)
-    schema = {}
+            print(f"[Warning] Schema invalidation listener failed: {e}")
 
-    tables = inspector.get_table_names()
-    for table in tables:
-        columns = inspector.get_columns(table)
-        schema[table] = [col['name'] for col in columns]
-    
-    return schema
-    
-def extract_sql_query(agent_response):
-    if re.match(r'^[\d.]+$', agent_response.strip()):
-        raise ValueError(f"Agent returned a numeric value instead of SQL: {agent_response}")
 
-    sql_match = re.search(r'```sql\s*(.*?)\s*```', agent_response, re.DOTALL)
-    if sql_match:
-        return sql_match.group(1).strip()
+def on_schema_loaded(listener):
+    """Register listener(engine, tables, fingerprint); it runs on the loading thread, so hand slow work off."""
+    _schema_listeners.append(listener)
 
-    sql_match = re.search(r'`(.*?)`', agent_response, re.DOTALL)
-    if sql_match:
-        return sql_match.group(1).strip()
 
-    sql_keywords = ['SELECT', 'INSERT', 'UPDATE', 'DELETE', 'CREATE', 'ALTER', 'DROP', 'SHOW']
-    for keyword in sql_keywords:
-        sql_match = re.search(f'{keyword}\\s+.*', agent_response, re.IGNORECASE | re.DOTALL)
-        if sql_match:
-            return sql_match.group(0).strip()
+def get_cached_fingerprint(engine):
+    """Fingerprint of the schema currently held in the cache, loading it if needed."""
+    get_schema_details(engine)
+    with _schema_cache_lock:
+        return _schema_cache[schema_identity(engine)]["fingerprint"]
 
-    if any(keyword in agent_response.upper() for keyword in sql_keywords):
-        return agent_response.strip()
 
-    raise ValueError(f"Could not identify SQL query in agent response: {agent_response}")
-    
-def is_valid_sql(query):
-    if re.match(r'^[\d.]+$', query.strip()):
-        return False
+def refresh_database_schema(engine):
+    invalidate_schema(schema_identity(engine))
+    return get_schema_details(engine, refresh=True)
 
-    if not query.upper().strip().startswith('SELECT'):
-        return False
 
-    select_keywords = ['SELECT', 'FROM', 'WHERE', 'JOIN', 'GROUP BY', 'ORDER BY', 'HAVING', 'LIMIT']
-    return any(keyword.upper() in query.upper() for keyword in select_keywords)
+def get_database_schema(engine):
+    return {table: [col["name"] for col in info["columns"]] for table, info in get_schema_details(engine).items()}
 
 
 def generate_natural_language_queries(schema):
@@ -0,0 +1,311 @@
+import json
+import os
+import re
+import sqlite3
+from collections import defaultdict
+from pathlib import Path
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+
+QUERY_TIMEOUT_SECONDS = float(os.getenv("QUERY_TIMEOUT_SECONDS", "30"))
+# The only directory sqlite and duckdb databases may be opened from; unset disables both
+LOCAL_DATA_ROOT = os.getenv("LOCAL_DATA_ROOT", "")
+
+
+class Dialect:
+    """Everything the pipeline needs to know about one kind of database.
+
+    `name` is both the dbtype clients send and SQLAlchemy's dialect name for the engine.
+    """
+
+    name = None
+    label = None
+    prompt_hint = ""
+    # No server-side statement timeout: the guard interrupts the connection after QUERY_TIMEOUT_SECONDS
+    interruptible = False
+    # Let the agent's SQLDatabase see views as well as tables
+    view_support = False
+    # Catalog queries used by utils.db; None falls back to SQLAlchemy reflection
+    columns_sql = None
+    constraints_sql = None
+    fingerprint_sql = None
+
+    def resolve_database(self, database):
+        """The database to connect to, checked before an engine is created."""
+        return database
+
+    def url(self, host, user, password, database):
+        raise NotImplementedError
+
+    def engine_options(self, database):
+        return {}
+
+    def on_connect(self, dbapi_connection, database):
+        """Read-only and timeout setup for every new pooled connection."""
+
+    def backend_id(self, connection):
+        """Server-side session id used to cancel a running query, or None."""
+        return None
+
+    def cancel(self, engine, backend_id, dbapi_connection):
+        dbapi_connection.interrupt()
+
+    def plan(self, connection, sql_query):
+        """{"cost", "rows", "examined"} planner estimates, or None when the database gives none."""
+        return None
+
+
+class PostgresDialect(Dialect):
+    name = "postgresql"
+    label = "PostgreSQL"
+    prompt_hint = "Quote identifiers with double quotes, use ILIKE for case-insensitive matching and date_trunc for date buckets."
+    columns_sql = """
+        SELECT c.table_name, c.column_name, c.data_type, c.is_nullable,
+               col_description(format('%I.%I', c.table_schema, c.table_name)::regclass, c.ordinal_position)
+        FROM information_schema.columns c
+        JOIN information_schema.tables t
+          ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+        WHERE c.table_schema = current_schema() AND t.table_type = 'BASE TABLE'
+        ORDER BY c.table_name, c.ordinal_position
+    """
+    constraints_sql = """
+        SELECT tc.table_name, kcu.column_name, tc.constraint_type, ccu.table_name, ccu.column_name
+        FROM information_schema.table_constraints tc
+        JOIN information_schema.key_column_usage kcu
+          ON kcu.constraint_name = tc.constraint_name AND kcu.table_schema = tc.table_schema
+        LEFT JOIN information_schema.constraint_column_usage ccu
+          ON tc.constraint_type = 'FOREIGN KEY'
+         AND ccu.constraint_name = tc.constraint_name AND ccu.constraint_schema = tc.table_schema
+        WHERE tc.table_schema = current_schema() AND tc.constraint_type IN ('PRIMARY KEY', 'FOREIGN KEY')
+        ORDER BY tc.table_name, kcu.ordinal_position
+    """
+    # Single-row digest of the catalog, cheap enough to run before every cache hit
+    fingerprint_sql = """
+        SELECT md5(string_agg(c.table_name || '.' || c.column_name || ':' || c.data_type || ':' || c.is_nullable,
+                              ',' ORDER BY c.table_name, c.ordinal_position))
+        FROM information_schema.columns c
+        WHERE c.table_schema = current_schema()
+    """
+
+    def url(self, host, user, password, database):
+        return f"postgresql+psycopg2://{user}:{password}@{host}/{database}"
+
+    def engine_options(self, database):
+        options = f"-c default_transaction_read_only=on -c statement_timeout={int(QUERY_TIMEOUT_SECONDS * 1000)}"
+        return {"connect_args": {"options": options}}
+
+    def backend_id(self, connection):
+        return connection.execute(text("SELECT pg_backend_pid()")).scalar()
+
+    def cancel(self, engine, backend_id, dbapi_connection):
+        with engine.connect() as connection:
+            connection.execute(text("SELECT pg_cancel_backend(:pid)"), {"pid": backend_id})
+
+    def plan(self, connection, sql_query):
+        plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql_query}")).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        root = plan[0]["Plan"]
+        return {"cost": root["Total Cost"], "rows": root["Plan Rows"], "examined": None}
+
+
+class MySQLDialect(Dialect):
+    name = "mysql"
+    label = "MySQL"
+    prompt_hint = "Quote identifiers with backticks and use DATE_FORMAT or YEAR() for date buckets."
+    columns_sql = """
+        SELECT c.table_name, c.column_name, c.data_type, c.is_nullable, c.column_comment
+        FROM information_schema.columns c
+        JOIN information_schema.tables t
+          ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+        WHERE c.table_schema = DATABASE() AND t.table_type = 'BASE TABLE'
+        ORDER BY c.table_name, c.ordinal_position
+    """
+    constraints_sql = """
+        SELECT k.table_name, k.column_name, t.constraint_type, k.referenced_table_name, k.referenced_column_name
+        FROM information_schema.key_column_usage k
+        JOIN information_schema.table_constraints t
+          ON t.constraint_name = k.constraint_name AND t.table_schema = k.table_schema AND t.table_name = k.table_name
+        WHERE k.table_schema = DATABASE() AND t.constraint_type IN ('PRIMARY KEY', 'FOREIGN KEY')
+        ORDER BY k.table_name, k.ordinal_position
+    """
+    fingerprint_sql = """
+        SELECT CONCAT(COUNT(*), '-', BIT_XOR(CRC32(CONCAT_WS(':', c.table_name, c.column_name, c.data_type, c.is_nullable))))
+        FROM information_schema.columns c
+        WHERE c.table_schema = DATABASE()
+    """
+
+    def url(self, host, user, password, database):
+        return f"mysql+mysqlconnector://{user}:{password}@{host}/{database}"
+
+    def on_connect(self, dbapi_connection, database):
+        # MySQL has no connect-time option for these, so they are set on every new connection
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute("SET SESSION TRANSACTION READ ONLY")
+            try:
+                cursor.execute(f"SET SESSION MAX_EXECUTION_TIME = {int(QUERY_TIMEOUT_SECONDS * 1000)}")
+            except Exception as e:
+                # MariaDB names it max_statement_time (in seconds)
+                print(f"[Warning] MAX_EXECUTION_TIME not supported, trying max_statement_time: {e}")
+                cursor.execute(f"SET SESSION max_statement_time = {QUERY_TIMEOUT_SECONDS}")
+        finally:
+            cursor.close()
+
+    def backend_id(self, connection):
+        return connection.execute(text("SELECT CONNECTION_ID()")).scalar()
+
+    def cancel(self, engine, backend_id, dbapi_connection):
+        with engine.connect() as connection:
+            connection.execute(text(f"KILL QUERY {int(backend_id)}"))
+
+    def plan(self, connection, sql_query):
+        # Rows multiply within one SELECT (nested loop joins) and add up across the SELECTs of a query
+        selects = defaultdict(lambda: [1.0, 1.0])
+        for row in connection.execute(text(f"EXPLAIN {sql_query}")).mappings():
+            if row.get("rows") is None:
+                continue
+            estimate = selects[row.get("id")]
+            estimate[0] *= float(row["rows"])
+            estimate[1] *= float(row["rows"]) * float(row.get("filtered") or 100.0) / 100.0
+        if not selects:
+            return None
+        return {
+            "cost": None,
+            "rows": sum(rows for _, rows in selects.values()),
+            "examined": sum(examined for examined, _ in selects.values()),
+        }
+
+
+def local_database_path(database):
+    """Resolve a client-supplied dbname to a path inside LOCAL_DATA_ROOT; symlinks out of the root are refused."""
+    if not LOCAL_DATA_ROOT:
+        raise HTTPException(status_code=403, detail="Local databases are disabled on this server")
+    root = Path(LOCAL_DATA_ROOT).resolve()
+    path = (root / database).resolve()
+    if path != root and root not in path.parents:
+        raise HTTPException(status_code=400, detail="dbname must be a path inside the local data directory")
+    if not path.exists():
+        raise HTTPException(status_code=404, detail=f"Local database not found: {database}")
+    return path
+
+
+class SQLiteDialect(Dialect):
+    """Local file databases under LOCAL_DATA_ROOT (benchmarks, exported snapshots); host and user are ignored."""
+
+    name = "sqlite"
+    label = "SQLite"
+    prompt_hint = "Use strftime for date parts; there is no ILIKE (LIKE is already case-insensitive for ASCII)."
+    interruptible = True
+
+    def resolve_database(self, database):
+        return str(local_database_path(database))
+
+    def on_connect(self, dbapi_connection, database):
+        # ATTACH would open any other file on the host
+        dbapi_connection.setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, 0)
+
+    def url(self, host, user, password, database):
+        return f"sqlite:///file:{database}?mode=ro&uri=true"
+
+    def engine_options(self, database):
+        return {"connect_args": {"check_same_thread": False}}
+
+
+_SNAPSHOT_READERS = {".parquet": "read_parquet", ".csv": "read_csv_auto", ".tsv": "read_csv_auto", ".json": "read_json_auto"}
+
+
+def _sql_path(path):
+    return path.as_posix().replace("'", "''")
+
+
+def _view_name(path):
+    return re.sub(r"\W+", "_", path.name.split(".")[0]).strip("_").lower() or "data"
+
+
+class DuckDBDialect(Dialect):
+    """Columnar engine for exported snapshots instead of the production OLTP database.
+
+    `dbname` is either a .duckdb file, opened read-only, or a directory of Parquet/CSV/JSON files
+    under LOCAL_DATA_ROOT,
+    each exposed as a view named after the file. A sub-directory of Parquet files becomes one
+    hive-partitioned view. Host and user are ignored.
+    """
+
+    name = "duckdb"
+    label = "DuckDB"
+    prompt_hint = "DuckDB follows PostgreSQL syntax: double-quoted identifiers, ILIKE, date_trunc and QUALIFY are available."
+    interruptible = True
+    view_support = True
+    columns_sql = """
+        SELECT c.table_name, c.column_name, c.data_type, c.is_nullable, NULL
+        FROM information_schema.columns c
+        WHERE c.table_schema = current_schema()
+        ORDER BY c.table_name, c.ordinal_position
+    """
+    constraints_sql = """
+        SELECT table_name, unnest(constraint_column_names), constraint_type, NULL, NULL
+        FROM duckdb_constraints()
+        WHERE schema_name = current_schema() AND constraint_type = 'PRIMARY KEY'
+    """
+    fingerprint_sql = """
+        SELECT md5(string_agg(c.table_name || '.' || c.column_name || ':' || c.data_type || ':' || c.is_nullable,
+                              ',' ORDER BY c.table_name, c.ordinal_position))
+        FROM information_schema.columns c
+        WHERE c.table_schema = current_schema()
+    """
+
+    @staticmethod
+    def _is_snapshot(database):
+        return Path(database).is_dir()
+
+    def resolve_database(self, database):
+        return str(local_database_path(database))
+
+    def url(self, host, user, password, database):
+        return "duckdb:///:memory:" if self._is_snapshot(database) else f"duckdb:///{database}"
+
+    def engine_options(self, database):
+        # :memory: would otherwise get SingletonThreadPool, which takes no pool size options
+        return {"poolclass": QueuePool} if self._is_snapshot(database) else {"connect_args": {"read_only": True}}
+
+    def snapshot_views(self, database):
+        """{view name: reader expression} for the files of a snapshot directory."""
+        views = {}
+        for path in sorted(Path(database).iterdir()):
+            if path.is_dir() and any(path.rglob("*.parquet")):
+                views[_view_name(path)] = f"read_parquet('{_sql_path(path)}/**/*.parquet', hive_partitioning = true)"
+            elif path.suffix.lower() in _SNAPSHOT_READERS:
+                views[_view_name(path)] = f"{_SNAPSHOT_READERS[path.suffix.lower()]}('{_sql_path(path)}')"
+        return views
+
+    def on_connect(self, dbapi_connection, database):
+        # Every pooled connection is its own in-memory database, so the views are created per connection
+        if self._is_snapshot(database):
+            for view, reader in self.snapshot_views(database).items():
+                dbapi_connection.execute(f'CREATE OR REPLACE VIEW "{view}" AS SELECT * FROM {reader}')
+        # Queries may only read files under the data root, and cannot lift that again
+        dbapi_connection.execute(f"SET allowed_directories = ['{_sql_path(Path(LOCAL_DATA_ROOT).resolve())}/']")
+        dbapi_connection.execute("SET enable_external_access = false")
+        dbapi_connection.execute("SET lock_configuration = true")
+
+
+DIALECTS = {}
+
+
+def register_dialect(dialect):
+    DIALECTS[dialect.name] = dialect
+    return dialect
+
+
+for _dialect in (PostgresDialect(), MySQLDialect(), SQLiteDialect(), DuckDBDialect()):
+    register_dialect(_dialect)
+
+
+def get_dialect(name):
+    dialect = DIALECTS.get(name)
+    if dialect is None:
+        choices = ", ".join(f"'{choice}'" for choice in DIALECTS)
+        raise HTTPException(status_code=400, detail=f"Unsupported database type: {name}. Choose one of {choices}.")
+    return dialect
@@ -0,0 +1,97 @@
+import asyncio
+import contextvars
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+CHAT_WORKERS = int(os.getenv("CHAT_WORKERS", "16"))
+TENANT_CONCURRENCY = int(os.getenv("TENANT_CONCURRENCY", "4"))
+
+# Blocking pipeline work (LangChain agent, LLM calls, DB cursors) runs here so the event loop stays free.
+_executor = ThreadPoolExecutor(max_workers=CHAT_WORKERS, thread_name_prefix="chat-worker")
+
+# The title is generated from inside a chat worker, alongside the summary; a pool of its own
+# keeps that call from queueing behind the very workers waiting on it.
+CHAT_TITLE_WORKERS = int(os.getenv("CHAT_TITLE_WORKERS", str(CHAT_WORKERS)))
+_title_executor = ThreadPoolExecutor(max_workers=CHAT_TITLE_WORKERS, thread_name_prefix="chat-title")
+
+# One semaphore per tenant database; entries disappear once no request holds them.
+_tenant_limits = weakref.WeakValueDictionary()
+
+# Shared backends (speech, offline translation, ...) get pools of their own, sized by the caller
+_resource_pools = {}
+
+
+def _tenant_semaphore(tenant):
+    semaphore = _tenant_limits.get(tenant)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(TENANT_CONCURRENCY)
+        _tenant_limits[tenant] = semaphore
+    return semaphore
+
+
+async def _run_in(executor, fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # Carry the caller's contextvars (request-scoped trace/timings) into the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, partial(context.run, fn, *args, **kwargs))
+
+
+async def run_blocking(tenant, fn, *args, **kwargs):
+    """Run fn in the shared worker pool, allowing at most TENANT_CONCURRENCY calls per tenant at once."""
+    semaphore = _tenant_semaphore(tenant)
+    async with semaphore:
+        return await _run_in(_executor, fn, *args, **kwargs)
+
+
+def _resource_pool(resource, workers):
+    executor = _resource_pools.get(resource)
+    if executor is None:
+        executor = _resource_pools.setdefault(resource, ThreadPoolExecutor(max_workers=workers, thread_name_prefix=resource))
+    return executor
+
+
+async def run_on_resource(resource, workers, fn, *args, **kwargs):
+    """Run fn in the pool dedicated to a shared resource, at most `workers` calls at once.
+
+    Long calls there (a whole speech synthesis, a CPU-bound model) neither use up a tenant's
+    slots nor hold threads the chat pipeline needs; extra calls wait their turn.
+    """
+    return await _run_in(_resource_pool(resource, workers), fn, *args, **kwargs)
+
+
+def submit_to_resource(resource, workers, fn, *args, **kwargs):
+    """run_on_resource for synchronous callers: start fn without waiting and return its concurrent.futures.Future."""
+    return _resource_pool(resource, workers).submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def submit_title(fn, *args, **kwargs):
+    """Start fn on the title pool with the caller's contextvars; returns a concurrent.futures.Future."""
+    return _title_executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def shutdown_executor():
+    _executor.shutdown(wait=False, cancel_futures=True)
+    _title_executor.shutdown(wait=False, cancel_futures=True)
+    for executor in _resource_pools.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Identical work already in flight, keyed by the caller: later callers await the first one's result
+_in_flight = {}
+
+
+async def single_flight(key, factory):
+    """Coalesce concurrent calls with the same key into one await of factory()."""
+    future = _in_flight.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    future = asyncio.ensure_future(factory())
+    _in_flight[key] = future
+    try:
+        return await asyncio.shield(future)
+    finally:
+        if _in_flight.get(key) is future:
+            del _in_flight[key]
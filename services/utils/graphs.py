@@ -0,0 +1,94 @@
+import re
+import pandas as pd
+
+PIE_MAX_CATEGORIES = 8
+BAR_MAX_CATEGORIES = 50
+TEMPORAL_NAME = re.compile(r"(date|time|year|month|week|day|season|quarter|period)", re.IGNORECASE)
+
+
+def _kind(name, series):
+    values = series.dropna()
+    if values.empty:
+        return "empty"
+    if pd.api.types.is_bool_dtype(values):
+        return "categorical"
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return "temporal"
+    if pd.api.types.is_numeric_dtype(values):
+        # Small integer ranges like 2008..2024 named "season"/"year" are time axes, not measures
+        if TEMPORAL_NAME.search(name) and pd.api.types.is_integer_dtype(values) and values.between(1900, 2100).all():
+            return "temporal"
+        return "numeric"
+
+    as_text = values.astype(str)
+    numeric = pd.to_numeric(as_text, errors="coerce")
+    if numeric.notna().mean() >= 0.95:
+        return "numeric"
+    if TEMPORAL_NAME.search(name) or as_text.str.match(r"^\d{4}-\d{2}").mean() >= 0.9:
+        parsed = pd.to_datetime(as_text, errors="coerce")
+        if parsed.notna().mean() >= 0.9:
+            return "temporal"
+    return "categorical"
+
+
+def profile_result(data):
+    """Column kinds (numeric/temporal/categorical/empty), cardinality and row count of a result set."""
+    frame = pd.DataFrame.from_records(data)
+    columns = []
+    for name in frame.columns:
+        series = frame[name]
+        columns.append({
+            "name": str(name),
+            "kind": _kind(str(name), series),
+            "cardinality": int(series.dropna().astype(str).nunique()),
+            "non_negative": bool((pd.to_numeric(series, errors="coerce").dropna() >= 0).all()),
+        })
+    return {"row_count": len(frame), "columns": columns}
+
+
+def _bucket(value):
+    for limit in (1, 2, PIE_MAX_CATEGORIES, BAR_MAX_CATEGORIES, 500):
+        if value <= limit:
+            return limit
+    return "many"
+
+
+def profile_signature(profile):
+    """Cache key: column kinds with bucketed cardinalities, independent of the actual values."""
+    parts = [f"rows:{_bucket(profile['row_count'])}"]
+    for col in profile["columns"]:
+        parts.append(f"{col['kind']}:{_bucket(col['cardinality'])}:{int(col['non_negative'])}")
+    return "|".join(parts)
+
+
+def recommend_from_profile(profile):
+    """Rule-based chart choice, or None when the shape is ambiguous and the LLM should decide."""
+    columns = [col for col in profile["columns"] if col["kind"] != "empty"]
+    numeric = [col for col in columns if col["kind"] == "numeric"]
+    temporal = [col for col in columns if col["kind"] == "temporal"]
+    categorical = [col for col in columns if col["kind"] == "categorical"]
+    rows = profile["row_count"]
+
+    if rows <= 1 or not numeric:
+        return ["table"] if rows <= 1 else None
+
+    if temporal and len(temporal) == 1:
+        return ["line", "area", "bar"]
+
+    if len(categorical) == 1 and not temporal:
+        category = categorical[0]
+        if category["cardinality"] > BAR_MAX_CATEGORIES:
+            return None
+        if len(numeric) == 1 and category["cardinality"] <= PIE_MAX_CATEGORIES and numeric[0]["non_negative"]:
+            return ["pie", "bar", "area"]
+        if len(numeric) == 1:
+            return ["bar", "line", "pie"]
+        return ["bar", "line", "area"]
+
+    if len(categorical) == 2 and len(numeric) == 1 and not temporal:
+        return ["heatmap", "bar", "scatter"]
+
+    if not categorical and not temporal and len(numeric) >= 2:
+        return ["scatter", "line", "bar"]
+
+    return None
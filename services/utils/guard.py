@@ -0,0 +1,158 @@
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi import HTTPException
+from utils.dialects import QUERY_TIMEOUT_SECONDS, get_dialect
+from utils.metrics import record_guard, stage
+from utils.sql_ast import has_limit
+
+QUERY_GUARD_ENABLED = os.getenv("QUERY_GUARD_ENABLED", "true").lower() == "true"
+# PostgreSQL planner cost units
+QUERY_GUARD_MAX_COST = float(os.getenv("QUERY_GUARD_MAX_COST", "10000000"))
+# Estimated rows read (MySQL multiplies the per-table estimates of a join)
+QUERY_GUARD_MAX_EXAMINED = float(os.getenv("QUERY_GUARD_MAX_EXAMINED", "100000000"))
+# Estimated result rows above which a LIMIT is added to queries that have none
+QUERY_GUARD_LIMIT_ROWS = float(os.getenv("QUERY_GUARD_LIMIT_ROWS", "100000"))
+
+
+class QueryCancelled(Exception):
+    pass
+
+
+def estimate_plan(connection, sql_query):
+    """{"cost", "rows", "examined"} planner estimates (None where the dialect has none), or None."""
+    try:
+        return get_dialect(connection.dialect.name).plan(connection, sql_query)
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        print(f"[Warning] Could not read the query plan: {e}")
+        return None
+
+
+def _over_budget(plan):
+    if plan["cost"] is not None and plan["cost"] > QUERY_GUARD_MAX_COST:
+        return f"estimated cost {plan['cost']:.0f} exceeds {QUERY_GUARD_MAX_COST:.0f}"
+    if plan["examined"] is not None and plan["examined"] > QUERY_GUARD_MAX_EXAMINED:
+        return f"it would read an estimated {plan['examined']:.0f} rows (limit {QUERY_GUARD_MAX_EXAMINED:.0f})"
+    return None
+
+
+def guard_query(connection, sql_query, limit):
+    """EXPLAIN the query before running it.
+
+    Returns the SQL to execute, with a LIMIT of `limit` rows added when a large result is expected
+    and the query has none. Raises a 422 when the plan is still over the cost/row budget.
+    """
+    sql_query = sql_query.strip().rstrip(";").strip()
+    if not QUERY_GUARD_ENABLED:
+        return sql_query
+
+    with stage("guard"):
+        plan = estimate_plan(connection, sql_query)
+        if plan is None:
+            record_guard("allowed")
+            return sql_query
+
+        action = "allowed"
+        if not has_limit(sql_query, connection.dialect.name) and (_over_budget(plan) or (plan["rows"] or 0) > QUERY_GUARD_LIMIT_ROWS):
+            sql_query = f"{sql_query}\nLIMIT {int(limit)}"
+            plan = estimate_plan(connection, sql_query) or plan
+            action = "limited"
+
+        reason = _over_budget(plan)
+        if reason:
+            record_guard("rejected")
+            raise HTTPException(status_code=422, detail=f"Query rejected before execution: {reason}. Try a narrower question.")
+
+    record_guard(action)
+    return sql_query
+
+
+def _backend_id(connection):
+    """Server-side id of the session, cached on the pooled DBAPI connection."""
+    info = connection.info
+    if "backend_id" not in info:
+        info["backend_id"] = get_dialect(connection.dialect.name).backend_id(connection)
+    return info["backend_id"]
+
+
+def _cancel_backend(engine, backend_id, dbapi_connection):
+    try:
+        get_dialect(engine.dialect.name).cancel(engine, backend_id, dbapi_connection)
+    except Exception as e:
+        print(f"[Warning] Could not cancel running query: {e}")
+
+
+class CancelScope:
+    """Lets the request that owns a query cancel it on the database server, e.g. when its client disconnects."""
+
+    def __init__(self):
+        self.cancelled = False
+        self._running = None
+        self._lock = threading.Lock()
+
+    def check(self):
+        if self.cancelled:
+            raise QueryCancelled("The request was cancelled")
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            running = self._running
+        if running is not None:
+            # Cancelling needs its own connection; keep that off the caller's thread (often the event loop)
+            threading.Thread(target=_cancel_backend, args=running, daemon=True).start()
+        record_guard("cancelled")
+
+    def _attach(self, running):
+        with self._lock:
+            self._running = running
+        self.check()
+
+    def _detach(self):
+        with self._lock:
+            self._running = None
+
+
+_current_scope = ContextVar("query_cancel_scope", default=None)
+
+
+@contextmanager
+def cancel_scope():
+    scope = CancelScope()
+    token = _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_scope.reset(token)
+
+
+def check_cancelled():
+    scope = _current_scope.get()
+    if scope is not None:
+        scope.check()
+
+
+@contextmanager
+def running_query(engine, connection):
+    """Register the query with the request's cancel scope while it runs.
+
+    Dialects without a server-side statement timeout (SQLite, DuckDB) are interrupted after QUERY_TIMEOUT_SECONDS here.
+    """
+    scope = _current_scope.get()
+    dbapi_connection = connection.connection.dbapi_connection
+    running = (engine, _backend_id(connection), dbapi_connection)
+    timer = None
+    if get_dialect(engine.dialect.name).interruptible and QUERY_TIMEOUT_SECONDS > 0:
+        timer = threading.Timer(QUERY_TIMEOUT_SECONDS, dbapi_connection.interrupt)
+        timer.daemon = True
+        timer.start()
+    try:
+        if scope is not None:
+            scope._attach(running)
+        yield
+    finally:
+        if scope is not None:
+            scope._detach()
+        if timer is not None:
+            timer.cancel()
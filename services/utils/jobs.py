@@ -0,0 +1,342 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit
+import orjson
+from fastapi import HTTPException
+from utils.results import dumps
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_STORE = os.getenv("JOB_STORE", "memory")
+JOB_SQLITE_PATH = os.getenv("JOB_SQLITE_PATH", "jobs.sqlite3")
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_MAX_PARTIAL_ROWS = int(os.getenv("JOB_MAX_PARTIAL_ROWS", "500"))
+JOB_CALLBACK_TIMEOUT = float(os.getenv("JOB_CALLBACK_TIMEOUT", "10"))
+# Comma-separated URL prefixes callbacks may be sent to (e.g. the Express server's base URL); empty disables callbacks
+JOB_CALLBACK_ALLOWED_URLS = [url.strip() for url in os.getenv("JOB_CALLBACK_ALLOWED_URLS", "").split(",") if url.strip()]
+# Signs callback bodies with HMAC-SHA256 in the X-Voxalize-Signature header when set
+JOB_CALLBACK_SECRET = os.getenv("JOB_CALLBACK_SECRET", "")
+# Every Nth dispatch goes to the lowest non-empty lane so reports are never starved by interactive work
+JOB_LOW_LANE_EVERY = int(os.getenv("JOB_LOW_LANE_EVERY", "4"))
+
+# Highest priority first
+LANES = ("interactive", "report")
+FINISHED = ("succeeded", "failed", "cancelled")
+
+
+class MemoryJobStore:
+    """Job records kept in the process; enough for one worker and for tests."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def save(self, job):
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def prune(self, before):
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items() if job["status"] in FINISHED and job["finished_at"] < before]:
+                del self._jobs[job_id]
+
+
+class SQLiteJobStore:
+    """Job records in a SQLite file, so finished results survive a restart and can be read by any worker on the host."""
+
+    def __init__(self, path=JOB_SQLITE_PATH):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, finished_at REAL, record BLOB NOT NULL)"
+        )
+        self._lock = threading.Lock()
+        # Jobs that were queued or running when the process stopped will never finish
+        with self._lock:
+            for job_id, record in self._conn.execute("SELECT id, record FROM jobs WHERE status IN ('queued', 'running')").fetchall():
+                job = orjson.loads(record)
+                job.update(status="failed", error="Interrupted by a service restart", finished_at=time.time())
+                self._write(job)
+
+    def _write(self, job):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO jobs (id, status, finished_at, record) VALUES (?, ?, ?, ?)",
+            (job["id"], job["status"], job["finished_at"], dumps(job)),
+        )
+
+    def save(self, job):
+        with self._lock:
+            self._write(job)
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT record FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return orjson.loads(row[0]) if row else None
+
+    def prune(self, before):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE status IN ('succeeded', 'failed', 'cancelled') AND finished_at < ?", (before,))
+
+
+def make_job_store(backend=JOB_STORE):
+    if backend == "sqlite":
+        return SQLiteJobStore()
+    return MemoryJobStore()
+
+
+def _url_parts(url):
+    parts = urlsplit(url)
+    port = parts.port or {"http": 80, "https": 443}.get(parts.scheme)
+    return parts.scheme, (parts.hostname or "").lower(), port, parts.path or "/"
+
+
+def check_callback_url(url):
+    """Callbacks carry query results, so they only go to the configured receivers."""
+    if not JOB_CALLBACK_ALLOWED_URLS:
+        raise HTTPException(status_code=400, detail="Job callbacks are not enabled on this server")
+    try:
+        scheme, host, port, path = _url_parts(url)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid callback_url")
+    for allowed in JOB_CALLBACK_ALLOWED_URLS:
+        allowed_scheme, allowed_host, allowed_port, allowed_path = _url_parts(allowed)
+        if (scheme in ("http", "https") and (scheme, host, port) == (allowed_scheme, allowed_host, allowed_port)
+                and path.startswith(allowed_path)):
+            return url
+    raise HTTPException(status_code=400, detail="callback_url is not one of the allowed callback receivers")
+
+
+def sign_callback(body):
+    return "sha256=" + hmac.new(JOB_CALLBACK_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def _apply_event(partial, event, payload):
+    """Fold a pipeline event into the job's partial result."""
+    if event == "sql":
+        partial["sql_query"] = payload["sql_query"]
+    elif event == "columns":
+        partial["columns"] = payload["columns"]
+    elif event == "rows":
+        rows = partial.setdefault("rows", [])
+        batch = payload["rows"]
+        if isinstance(batch, dict):
+            # Columnar batches: row arrays under "data"
+            batch = batch["data"]
+        rows.extend(batch[:max(JOB_MAX_PARTIAL_ROWS - len(rows), 0)])
+        partial["row_count"] = partial.get("row_count", 0) + len(batch)
+    elif event == "summary_token":
+        partial["summary"] = partial.get("summary", "") + payload.get("token", "")
+    elif event in ("summary", "title"):
+        partial[event] = payload[event]
+    elif event in ("thought", "observation"):
+        partial["steps"] = partial.get("steps", 0) + 1
+    partial["last_event"] = event
+
+
+class JobQueue:
+    """Background jobs with priority lanes and round-robin fairness between tenants inside a lane.
+
+    Runners are registered per kind as `async runner(payload, on_event)`; payloads (which may hold
+    credentials) stay in memory and are never written to the store.
+    """
+
+    def __init__(self, store=None, workers=JOB_WORKERS):
+        self.store = store or make_job_store()
+        self.workers = workers
+        self._runners = {}
+        # lane -> tenant -> deque of job ids, tenants in round-robin order
+        self._lanes = {lane: OrderedDict() for lane in LANES}
+        self._payloads = {}
+        self._partials = {}
+        self._tasks = {}
+        self._callbacks = {}
+        self._wakeup = None
+        self._workers = []
+        self._dispatched = 0
+        self._http = None
+
+    def register(self, kind, runner):
+        self._runners[kind] = runner
+
+    def start(self):
+        if self._workers:
+            return
+        self._wakeup = asyncio.Semaphore(0)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._tasks.values(), return_exceptions=True)
+        self._workers = []
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def submit(self, kind, payload, tenant, lane="report", callback_url=None, metadata=None):
+        if kind not in self._runners:
+            raise ValueError(f"No runner registered for job kind {kind!r}")
+        if lane not in self._lanes:
+            raise ValueError(f"Unknown lane {lane!r}; choose one of {', '.join(LANES)}")
+        if callback_url:
+            check_callback_url(callback_url)
+        self.start()
+        now = time.time()
+        self.store.prune(now - JOB_RESULT_TTL)
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "lane": lane,
+            "status": "queued",
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+            "metadata": metadata,
+            "result": None,
+            "error": None,
+        }
+        self.store.save(job)
+        self._payloads[job["id"]] = payload
+        self._partials[job["id"]] = {}
+        if callback_url:
+            self._callbacks[job["id"]] = callback_url
+        self._lanes[lane].setdefault(tenant, deque()).append(job["id"])
+        self._wakeup.release()
+        return job
+
+    def get(self, job_id):
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        if job["status"] not in FINISHED:
+            job["partial"] = dict(self._partials.get(job_id, {}))
+            job["position"] = self._position(job_id) if job["status"] == "queued" else None
+        return job
+
+    def _position(self, job_id):
+        position = 0
+        for lane in LANES:
+            for queue in self._lanes[lane].values():
+                if job_id in queue:
+                    return position + queue.index(job_id)
+                position += len(queue)
+        return None
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns the job, or None if it does not exist."""
+        job = self.store.get(job_id)
+        if job is None or job["status"] in FINISHED:
+            return job
+        for tenants in self._lanes.values():
+            for tenant, queue in list(tenants.items()):
+                if job_id in queue:
+                    queue.remove(job_id)
+                    if not queue:
+                        del tenants[tenant]
+                    self._finish(job, "cancelled")
+                    return job
+        task = self._tasks.get(job_id)
+        if task is not None:
+            # The runner sees CancelledError, which also cancels its database query
+            task.cancel()
+        return self.store.get(job_id)
+
+    def _next(self):
+        self._dispatched += 1
+        lanes = [lane for lane in LANES if self._lanes[lane]]
+        if not lanes:
+            return None
+        lane = lanes[-1] if JOB_LOW_LANE_EVERY and self._dispatched % JOB_LOW_LANE_EVERY == 0 else lanes[0]
+        tenants = self._lanes[lane]
+        tenant, queue = next(iter(tenants.items()))
+        job_id = queue.popleft()
+        del tenants[tenant]
+        if queue:
+            tenants[tenant] = queue
+        return job_id
+
+    async def _work(self):
+        while True:
+            await self._wakeup.acquire()
+            job_id = self._next()
+            if job_id is None:
+                continue
+            task = asyncio.create_task(self._run(job_id))
+            self._tasks[job_id] = task
+            try:
+                # wait() rather than await, so cancelling the job does not stop this worker
+                await asyncio.wait({task})
+            finally:
+                self._tasks.pop(job_id, None)
+
+    async def _run(self, job_id):
+        job = self.store.get(job_id)
+        payload = self._payloads.get(job_id)
+        partial = self._partials.setdefault(job_id, {})
+        loop = asyncio.get_running_loop()
+
+        def on_event(event, data):
+            # Called from worker threads; partial results are only touched on the event loop
+            loop.call_soon_threadsafe(_apply_event, partial, event, data)
+
+        job.update(status="running", started_at=time.time())
+        self.store.save(job)
+        try:
+            result = await self._runners[job["kind"]](payload, on_event)
+        except asyncio.CancelledError:
+            self._finish(job, "cancelled")
+            raise
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e)
+            self._finish(job, "failed", error=str(detail).splitlines()[0] if detail else type(e).__name__)
+        else:
+            self._finish(job, "succeeded", result=result)
+
+    def _finish(self, job, status, result=None, error=None):
+        job.update(status=status, finished_at=time.time(), result=result, error=error)
+        self.store.save(job)
+        self._payloads.pop(job["id"], None)
+        self._partials.pop(job["id"], None)
+        callback_url = self._callbacks.pop(job["id"], None)
+        if callback_url:
+            asyncio.get_running_loop().create_task(self._callback(callback_url, job))
+
+    async def _callback(self, url, job):
+        import httpx
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=JOB_CALLBACK_TIMEOUT)
+        body = dumps(job)
+        headers = {"Content-Type": "application/json"}
+        if JOB_CALLBACK_SECRET:
+            headers["X-Voxalize-Signature"] = sign_callback(body)
+        try:
+            # Redirects are not followed, so an allowed receiver cannot bounce the results elsewhere
+            response = await self._http.post(url, content=body, headers=headers, follow_redirects=False)
+            response.raise_for_status()
+        except Exception as e:
+            print(f"[Warning] Job {job['id']} callback to {url} failed: {e}")
+
+    def stats(self):
+        return {
+            "queued": {lane: sum(len(queue) for queue in tenants.values()) for lane, tenants in self._lanes.items()},
+            "running": len(self._tasks),
+            "workers": len(self._workers),
+        }
+
+
+job_queue = JobQueue()
@@ -0,0 +1,295 @@
+import hashlib
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from dotenv import load_dotenv
+from utils.cache import make_cache
+from utils.metrics import record_cache, record_llm_call, record_llm_retry, stage
+from utils.results import dumps
+
+load_dotenv()
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "groq")
+LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.3-70b-versatile")
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "llama-3.1-8b-instant")
+# Separate keys keep the SQL agent's many calls from using up the other endpoints' rate limit
+GROQ_API_KEY = os.getenv("GROQ_API_KEY_2")
+GROQ_CHAT_API_KEY = os.getenv("GROQ_API_KEY_6")
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+# Requests per minute allowed per API key; 0 leaves pacing to the 429 backoff alone
+LLM_RATE_LIMIT_RPM = float(os.getenv("LLM_RATE_LIMIT_RPM", "0"))
+LLM_RATE_LIMIT_BURST = int(os.getenv("LLM_RATE_LIMIT_BURST", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+# Completions at or below this temperature are close enough to deterministic to be cached
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.2"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "4096"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "3600"))
+
+# Tasks answered well enough by the small model; everything else uses LLM_MODEL
+MODEL_ROUTES = {
+    "title": LLM_FAST_MODEL,
+    "recommend": LLM_FAST_MODEL,
+    "search_completions": LLM_FAST_MODEL,
+    "graph_recommend": LLM_FAST_MODEL,
+}
+
+RETRY_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+_responses = make_cache("llm_responses", max_entries=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL)
+_lock = threading.Lock()
+_http_client = None
+_clients = {}
+_chat_models = {}
+_buckets = {}
+_in_flight = {}
+
+
+def model_for(task):
+    return MODEL_ROUTES.get(task, LLM_MODEL)
+
+
+class TokenBucket:
+    """Blocking token bucket: rate tokens per second, holding at most burst."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        # Seconds to wait before a token is available; 0 when one was taken
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, blocking=True):
+        while True:
+            wait = self._take()
+            if not wait:
+                return True
+            if not blocking:
+                return False
+            time.sleep(wait)
+
+
+def rate_limiter(api_key):
+    """The bucket shared by every call made with api_key, or None when rate limiting is off."""
+    if LLM_RATE_LIMIT_RPM <= 0:
+        return None
+    key = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+    with _lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = TokenBucket(LLM_RATE_LIMIT_RPM / 60, LLM_RATE_LIMIT_BURST)
+        return bucket
+
+
+def http_client():
+    """One keep-alive connection pool for every Groq client in the process."""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            import httpx
+            _http_client = httpx.Client(
+                timeout=LLM_TIMEOUT,
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS),
+            )
+        return _http_client
+
+
+def _groq_client(api_key):
+    from groq import Groq
+    return Groq(api_key=api_key, http_client=http_client(), max_retries=0)
+
+
+def _groq_chat_model(model, api_key):
+    from langchain_core.rate_limiters import BaseRateLimiter
+    from langchain_groq import ChatGroq
+
+    class BucketLimiter(BaseRateLimiter):
+        def __init__(self, bucket):
+            self.bucket = bucket
+
+        def acquire(self, *, blocking=True):
+            return self.bucket.acquire(blocking)
+
+        async def aacquire(self, *, blocking=True):
+            import asyncio
+            return await asyncio.to_thread(self.bucket.acquire, blocking)
+
+    bucket = rate_limiter(api_key)
+    return ChatGroq(
+        groq_api_key=api_key,
+        model_name=model,
+        streaming=False,
+        http_client=http_client(),
+        # The Groq SDK backs off exponentially on 429s and honours Retry-After
+        max_retries=LLM_MAX_RETRIES,
+        rate_limiter=BucketLimiter(bucket) if bucket is not None else None,
+    )
+
+
+# name -> (client factory(api_key), chat model factory(model, api_key))
+BACKENDS = {
+    "groq": (_groq_client, _groq_chat_model),
+}
+
+
+def register_backend(name, client_factory, chat_model_factory):
+    """Add a backend, e.g. the offline fakes that tests and benchmarks register from benchmarks/fake_llm.py."""
+    BACKENDS[name] = (client_factory, chat_model_factory)
+
+
+def use_backend(name):
+    """Switch every later client and chat model to another registered backend."""
+    global LLM_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {name}. Choose one of {', '.join(BACKENDS)}.")
+    with _lock:
+        LLM_BACKEND = name
+        _clients.clear()
+        _chat_models.clear()
+    _responses.clear()
+
+
+def _backend():
+    if LLM_BACKEND not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {LLM_BACKEND}. Choose one of {', '.join(BACKENDS)}.")
+    return BACKENDS[LLM_BACKEND]
+
+
+def groq_client(api_key=None):
+    """Shared client for api_key (GROQ_API_KEY_2 by default), also used for speech endpoints."""
+    api_key = api_key or GROQ_API_KEY
+    client = _clients.get(api_key)
+    if client is None:
+        client = _backend()[0](api_key)
+        with _lock:
+            client = _clients.setdefault(api_key, client)
+    return client
+
+
+def chat_model(task="sql"):
+    """Shared LangChain chat model for the task's model, built once per process."""
+    model = model_for(task)
+    chat = _chat_models.get(model)
+    if chat is None:
+        chat = _backend()[1](model, GROQ_CHAT_API_KEY)
+        with _lock:
+            chat = _chat_models.setdefault(model, chat)
+    return chat
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return min(float(value), LLM_BACKOFF_MAX) if value is not None else None
+    except ValueError:
+        return None
+
+
+def _retryable(error):
+    if getattr(error, "status_code", None) in RETRY_STATUS:
+        return True
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def _create_with_retries(api_key, request):
+    bucket = rate_limiter(api_key)
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        if bucket is not None:
+            bucket.acquire()
+        try:
+            return groq_client(api_key).chat.completions.create(**request)
+        except Exception as e:
+            if attempt == LLM_MAX_RETRIES or not _retryable(e):
+                raise
+            record_llm_retry(request["model"])
+            delay = _retry_after(e)
+            if delay is None:
+                # Full jitter keeps callers that were throttled together from retrying together
+                delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+            print(f"[Warning] LLM call to {request['model']} failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def _complete(api_key, request, stage_name):
+    started = time.perf_counter()
+    with stage(stage_name):
+        response = _create_with_retries(api_key, request)
+    usage = getattr(response, "usage", None)
+    record_llm_call(
+        request["model"],
+        getattr(usage, "prompt_tokens", 0),
+        getattr(usage, "completion_tokens", 0),
+        time.perf_counter() - started
+    )
+    return response.choices[0].message.content
+
+
+def complete(task, messages, temperature=0.2, max_tokens=None, response_format=None, api_key=None):
+    """Chat completion text for messages, with the model picked by task; blocking.
+
+    Identical requests already in flight share one call, and those at low temperature are also
+    answered from the response cache.
+    """
+    api_key = api_key or GROQ_API_KEY
+    request = {"model": model_for(task), "messages": messages, "temperature": temperature}
+    if max_tokens is not None:
+        request["max_tokens"] = max_tokens
+    if response_format is not None:
+        request["response_format"] = response_format
+    key = hashlib.sha256(dumps(request)).hexdigest()
+
+    cacheable = temperature <= LLM_CACHE_MAX_TEMPERATURE
+    if cacheable:
+        cached = _responses.get(key)
+        record_cache("llm", cached is not None)
+        if cached is not None:
+            return cached
+
+    with _lock:
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = _in_flight[key] = Future()
+    if not leader:
+        return future.result()
+
+    try:
+        content = _complete(api_key, request, f"{task}_llm")
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(content)
+        if cacheable:
+            _responses.set(key, content)
+        return content
+    finally:
+        with _lock:
+            _in_flight.pop(key, None)
+
+
+def close_clients():
+    global _http_client
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+        _clients.clear()
+        _chat_models.clear()
@@ -0,0 +1,123 @@
+import contextvars
+import time
+from contextlib import contextmanager, nullcontext
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+try:
+    from opentelemetry import trace as otel_trace
+    _tracer = otel_trace.get_tracer("voxalize.services")
+except ImportError:
+    _tracer = None
+
+STAGE_SECONDS = Histogram(
+    "voxalize_stage_seconds",
+    "Wall time spent in each pipeline stage",
+    ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+LLM_CALLS = Counter("voxalize_llm_calls_total", "LLM calls by model", ["model"])
+LLM_TOKENS = Counter("voxalize_llm_tokens_total", "LLM tokens by model and kind (prompt/completion)", ["model", "kind"])
+LLM_RETRIES = Counter("voxalize_llm_retries_total", "LLM calls retried after a rate limit or transient error", ["model"])
+LLM_SECONDS = Histogram(
+    "voxalize_llm_call_seconds",
+    "Latency of individual LLM calls",
+    ["model"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64),
+)
+DB_ROWS = Histogram(
+    "voxalize_db_rows_returned",
+    "Rows returned per executed query",
+    buckets=(0, 1, 10, 100, 1000, 10000, 100000),
+)
+DB_BYTES = Histogram(
+    "voxalize_db_result_bytes",
+    "Encoded size of the rows returned per executed query",
+    buckets=(1e2, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8),
+)
+CACHE_REQUESTS = Counter("voxalize_cache_requests_total", "Cache lookups by cache and result (hit/miss)", ["cache", "result"])
+QUERY_GUARD = Counter("voxalize_query_guard_total", "Pre-execution guard decisions (allowed/limited/rejected/cancelled)", ["action"])
+
+# Per-request stage timings, filled in when a request asks for them
+_timings = contextvars.ContextVar("voxalize_timings", default=None)
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage into the stage histogram, the request's timings and an OpenTelemetry span if available."""
+    span = _tracer.start_as_current_span(name) if _tracer is not None else nullcontext()
+    started = time.perf_counter()
+    try:
+        with span:
+            yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(name).observe(elapsed)
+        timings = _timings.get()
+        if timings is not None:
+            timings[name] = round(timings.get(name, 0.0) + elapsed, 4)
+
+
+@contextmanager
+def collect_timings():
+    timings = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def record_llm_call(model, prompt_tokens, completion_tokens, duration=None):
+    model = model or "unknown"
+    LLM_CALLS.labels(model).inc()
+    LLM_TOKENS.labels(model, "prompt").inc(prompt_tokens or 0)
+    LLM_TOKENS.labels(model, "completion").inc(completion_tokens or 0)
+    if duration is not None:
+        LLM_SECONDS.labels(model).observe(duration)
+
+
+def record_llm_retry(model):
+    LLM_RETRIES.labels(model or "unknown").inc()
+
+
+def record_query_result(rows, result_bytes):
+    DB_ROWS.observe(rows)
+    DB_BYTES.observe(result_bytes)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_guard(action):
+    QUERY_GUARD.labels(action).inc()
+
+
+class _PoolCollector:
+    """Reads connection pool utilisation from the engine registry at scrape time."""
+
+    def describe(self):
+        # Without this, register() calls collect() straight away, while utils.db is still importing this module
+        return []
+
+    def collect(self):
+        from utils.db import pool_status
+
+        size = GaugeMetricFamily("voxalize_db_pool_size", "Configured pool size per database", labels=["database"])
+        checked_out = GaugeMetricFamily("voxalize_db_pool_checked_out", "Connections currently in use per database", labels=["database"])
+        overflow = GaugeMetricFamily("voxalize_db_pool_overflow", "Connections opened beyond pool_size per database", labels=["database"])
+        for database, status in pool_status().items():
+            size.add_metric([database], status["size"])
+            checked_out.add_metric([database], status["checked_out"])
+            overflow.add_metric([database], status["overflow"])
+        yield size
+        yield checked_out
+        yield overflow
+
+
+REGISTRY.register(_PoolCollector())
+
+
+def render_metrics():
+    return generate_latest(), CONTENT_TYPE_LATEST
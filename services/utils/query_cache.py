@@ -0,0 +1,123 @@
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import deque
+from utils.cache import make_cache
+from utils.metrics import record_cache
+
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "4096"))
+QUERY_CACHE_SQL_TTL = int(os.getenv("QUERY_CACHE_SQL_TTL", str(7 * 24 * 3600)))
+# Results go stale as data changes; 0 caches only the generated SQL
+QUERY_CACHE_RESULT_TTL = int(os.getenv("QUERY_CACHE_RESULT_TTL", "300"))
+QUERY_CACHE_SIMILARITY = os.getenv("QUERY_CACHE_SIMILARITY", "false").lower() in ("1", "true", "yes")
+QUERY_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("QUERY_CACHE_SIMILARITY_THRESHOLD", "0.9"))
+QUERY_CACHE_SIMILARITY_CANDIDATES = int(os.getenv("QUERY_CACHE_SIMILARITY_CANDIDATES", "512"))
+
+EMBEDDING_DIMENSIONS = 1 << 16
+
+
+def normalize_question(question):
+    question = question.lower()
+    question = re.sub(r"[^\w\s]", " ", question)
+    return " ".join(question.split())
+
+
+def embed(question):
+    """Sparse hashed embedding of word unigrams and bigrams, L2 normalised; cheap and fully local."""
+    words = normalize_question(question).split()
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    vector = {}
+    for feature in features:
+        bucket = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big") % EMBEDDING_DIMENSIONS
+        vector[bucket] = vector.get(bucket, 0.0) + 1.0
+    norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+    return {bucket: weight / norm for bucket, weight in vector.items()}
+
+
+def cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(bucket, 0.0) for bucket, weight in a.items())
+
+
+def _numbers(question):
+    return sorted(re.findall(r"\d+(?:\.\d+)?", question))
+
+
+class QueryCache:
+    """Two-tier NL->SQL cache.
+
+    Exact tier: normalized question + database identity + schema fingerprint, stored in the
+    configured cache backend. Similarity tier (optional): hashed-embedding cosine match among
+    recent questions for the same database and schema version, requiring identical numbers so
+    "top 5" never answers "top 10".
+    """
+
+    def __init__(self):
+        self._entries = make_cache("nl2sql", max_entries=QUERY_CACHE_MAX_ENTRIES, ttl=QUERY_CACHE_SQL_TTL)
+        self._recent = {}
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "stores": 0, "seconds_saved": 0.0}
+
+    @staticmethod
+    def _key(identity, fingerprint, normalized):
+        return hashlib.sha256(f"{identity}|{fingerprint}|{normalized}".encode("utf-8")).hexdigest()
+
+    def lookup(self, identity, fingerprint, question):
+        """Returns (entry, tier) where tier is "exact" or "similar", or (None, None)."""
+        if not QUERY_CACHE_ENABLED:
+            return None, None
+
+        normalized = normalize_question(question)
+        entry = self._entries.get(self._key(identity, fingerprint, normalized))
+        tier = "exact" if entry is not None else None
+
+        if entry is None and QUERY_CACHE_SIMILARITY:
+            vector, numbers = embed(question), _numbers(question)
+            with self._lock:
+                candidates = list(self._recent.get((identity, fingerprint), ()))
+            best_score, best_key = 0.0, None
+            for candidate_vector, candidate_numbers, key in candidates:
+                if candidate_numbers != numbers:
+                    continue
+                score = cosine(vector, candidate_vector)
+                if score > best_score:
+                    best_score, best_key = score, key
+            if best_key is not None and best_score >= QUERY_CACHE_SIMILARITY_THRESHOLD:
+                entry = self._entries.get(best_key)
+                tier = "similar" if entry is not None else None
+
+        record_cache("nl2sql", entry is not None)
+        with self._lock:
+            if entry is None:
+                self._stats["misses"] += 1
+            else:
+                self._stats[f"{tier}_hits"] += 1
+                self._stats["seconds_saved"] += entry.get("generation_seconds", 0.0)
+        return entry, tier
+
+    def store(self, identity, fingerprint, question, entry):
+        if not QUERY_CACHE_ENABLED:
+            return
+
+        key = self._key(identity, fingerprint, normalize_question(question))
+        self._entries.set(key, entry)
+        with self._lock:
+            self._stats["stores"] += 1
+            if QUERY_CACHE_SIMILARITY:
+                recent = self._recent.setdefault((identity, fingerprint), deque(maxlen=QUERY_CACHE_SIMILARITY_CANDIDATES))
+                recent.append((embed(question), _numbers(question), key))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["exact_hits"] + stats["similar_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["similar_hits"]) / lookups if lookups else 0.0
+        stats["entries"] = len(self._entries)
+        return stats
+
+
+query_cache = QueryCache()
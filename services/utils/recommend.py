@@ -0,0 +1,91 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from utils.cache import make_cache
+from utils.chat import generate_sql_fast
+from utils.completions import completion_indexes
+from utils.db import get_cached_fingerprint, schema_identity
+from utils.dialects import get_dialect
+from utils.llm import chat_model
+from utils.metrics import record_cache, stage
+from utils.query_cache import query_cache
+
+RECOMMEND_TTL = int(os.getenv("RECOMMEND_TTL", str(24 * 3600)))
+RECOMMEND_VALIDATE = os.getenv("RECOMMEND_VALIDATE", "true").lower() == "true"
+RECOMMEND_VALIDATION_WORKERS = int(os.getenv("RECOMMEND_VALIDATION_WORKERS", "5"))
+
+# One entry per database: {"fingerprint", "queries", "generated_at"}
+_recommendations = make_cache("recommendations", max_entries=1024, ttl=RECOMMEND_TTL)
+
+
+def check_sql_runs(engine, sql_query):
+    """Plan the query without running it; raises if it does not compile against the database.
+
+    EXPLAIN takes the query as is: wrapping it in a derived table fails on MySQL for joins with repeated column names.
+    """
+    with engine.connect() as connection:
+        connection.execute(text(f"EXPLAIN {sql_query}")).fetchall()
+
+
+def _compile_question(llm, engine, dialect, question):
+    started = time.perf_counter()
+    try:
+        sql_query, thought_process = generate_sql_fast(llm, engine, dialect, question)
+        check_sql_runs(engine, sql_query)
+    except Exception as e:
+        print(f"[Warning] Dropping recommended query {question!r}: {e}")
+        return None
+    return {
+        "sql_query": sql_query,
+        "generation_mode": "fast",
+        "agent_thought_process": thought_process,
+        "generation_seconds": time.perf_counter() - started,
+    }
+
+
+def validate_questions(engine, questions):
+    """Keep only the questions that compile to SQL the database accepts.
+
+    The generated SQL goes into the query cache, so picking a suggestion skips SQL generation.
+    """
+    llm = chat_model()
+    dialect = get_dialect(engine.dialect.name)
+    with ThreadPoolExecutor(max_workers=RECOMMEND_VALIDATION_WORKERS, thread_name_prefix="recommend") as pool:
+        compiled = list(pool.map(lambda question: _compile_question(llm, engine, dialect, question), questions))
+
+    identity = schema_identity(engine)
+    fingerprint = get_cached_fingerprint(engine)
+    answerable = []
+    for question, entry in zip(questions, compiled):
+        if entry is not None:
+            query_cache.store(identity, fingerprint, question, entry)
+            answerable.append(question)
+    return answerable
+
+
+def cached_recommendations(engine):
+    """(queries, fresh) for the database; queries is None when nothing was generated yet."""
+    entry = _recommendations.get(schema_identity(engine))
+    record_cache("recommendations", entry is not None)
+    if entry is None:
+        return None, False
+    return entry["queries"], entry["fingerprint"] == get_cached_fingerprint(engine)
+
+
+def build_recommendations(engine, generate):
+    """Generate suggestions with generate(engine), validate them and cache them for this schema version; blocking."""
+    fingerprint = get_cached_fingerprint(engine)
+    with stage("recommend_generate"):
+        questions = [question for question in generate(engine) if isinstance(question, str) and question.strip()]
+    if RECOMMEND_VALIDATE:
+        with stage("recommend_validate"):
+            questions = validate_questions(engine, questions)
+
+    _recommendations.set(schema_identity(engine), {
+        "fingerprint": fingerprint,
+        "queries": questions,
+        "generated_at": time.time(),
+    })
+    completion_indexes.add_suggestions(engine, questions)
+    return questions
@@ -0,0 +1,75 @@
+import os
+from datetime import timedelta
+from decimal import Decimal
+import orjson
+import pandas as pd
+from fastapi.responses import JSONResponse
+
+DIGEST_FULL_ROWS = int(os.getenv("DIGEST_FULL_ROWS", "20"))
+DIGEST_SAMPLE_ROWS = int(os.getenv("DIGEST_SAMPLE_ROWS", "5"))
+DIGEST_TOP_VALUES = int(os.getenv("DIGEST_TOP_VALUES", "5"))
+
+
+RESULT_FORMATS = ("rows", "columnar")
+
+
+def _json_default(value):
+    # orjson already covers str/int/float/bool/None, datetime/date/time, UUID and numpy types
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode("utf-8", errors="replace")
+    if isinstance(value, timedelta):
+        return str(value)
+    return str(value)
+
+
+def dumps(content):
+    return orjson.dumps(content, default=_json_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+class ResultJSONResponse(JSONResponse):
+    """JSON response encoded by orjson, skipping FastAPI's per-value jsonable_encoder pass."""
+
+    def render(self, content):
+        return dumps(content)
+
+
+def format_result(columns, records, result_format="rows"):
+    """Shape raw cursor tuples as a list of row objects or as {"columns": [...], "data": [[...]]}."""
+    if result_format == "columnar":
+        return {"columns": columns, "data": records}
+    return [dict(zip(columns, record)) for record in records]
+
+
+def describe_result(columns, records, truncated=False):
+    """Compact text description of a result set for LLM prompts.
+
+    Small results are passed through verbatim; larger ones are reduced to per-column
+    statistics plus a few sample rows so the prompt size does not grow with the table.
+    """
+    if not records:
+        return "Query returned no rows."
+
+    header = f"Rows returned: {len(records)}" + (" (result was truncated at the row/byte cap)" if truncated else "")
+    if len(records) <= DIGEST_FULL_ROWS:
+        return f"{header}\n{dumps(format_result(columns, records)).decode()}"
+
+    frame = pd.DataFrame.from_records(records, columns=columns)
+    lines = [header, "Columns:"]
+    for column in columns:
+        series = frame[column]
+        nulls = int(series.isna().sum())
+        numeric = pd.to_numeric(series, errors="coerce")
+        if series.notna().any() and numeric.notna().sum() == series.notna().sum():
+            lines.append(
+                f"- {column} (numeric): min {numeric.min():g}, max {numeric.max():g}, "
+                f"mean {numeric.mean():g}, sum {numeric.sum():g}, nulls {nulls}"
+            )
+        else:
+            counts = series.astype(str).value_counts()
+            top = ", ".join(f"{value} ({count})" for value, count in counts.head(DIGEST_TOP_VALUES).items())
+            lines.append(f"- {column} (text): {len(counts)} distinct, nulls {nulls}; most common: {top}")
+
+    lines.append(f"First {DIGEST_SAMPLE_ROWS} rows: {dumps(format_result(columns, records[:DIGEST_SAMPLE_ROWS])).decode()}")
+    return "\n".join(lines)
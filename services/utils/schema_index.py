@@ -0,0 +1,169 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+from utils.db import get_cached_fingerprint, get_schema_details, on_schema_invalidated, schema_identity
+
+SCHEMA_INDEX_DIR = Path(os.getenv("SCHEMA_INDEX_DIR", ".schema_index"))
+SCHEMA_INDEX_TOP_K = int(os.getenv("SCHEMA_INDEX_TOP_K", "8"))
+# Set to false to send whole schemas again, e.g. to compare prompt sizes before/after pruning
+SCHEMA_PRUNING = os.getenv("SCHEMA_PRUNING", "true").lower() in ("1", "true", "yes")
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+# Table names count more than a single column or comment mention
+TABLE_NAME_WEIGHT = 3
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def tokenize(value):
+    """Split identifiers and prose into lowercase stems: "playerMatchStats" / "player_match_stats" -> player, match, stat."""
+    if not value:
+        return []
+    value = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", str(value))
+    words = re.split(r"[^a-zA-Z0-9]+", value.lower())
+    return [word[:-1] if len(word) > 3 and word.endswith("s") else word for word in words if len(word) > 1]
+
+
+def build_index(tables):
+    postings = {}
+    lengths = {}
+    neighbours = {table: set() for table in tables}
+    for table, info in tables.items():
+        terms = tokenize(table) * TABLE_NAME_WEIGHT
+        for col in info["columns"]:
+            terms += tokenize(col["name"]) + tokenize(col.get("comment"))
+        lengths[table] = len(terms)
+        for term, count in Counter(terms).items():
+            postings.setdefault(term, {})[table] = count
+        for fk in info["foreign_keys"]:
+            if fk["referred_table"] in tables:
+                neighbours[table].add(fk["referred_table"])
+                neighbours[fk["referred_table"]].add(table)
+
+    return {
+        "postings": postings,
+        "lengths": lengths,
+        "avgdl": (sum(lengths.values()) / len(lengths)) if lengths else 0.0,
+        "neighbours": {table: sorted(linked) for table, linked in neighbours.items()},
+    }
+
+
+def _digest(value):
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:32]
+
+
+def _index_path(identity, fingerprint):
+    # Named <database>-<schema version>.json so every version of one database can be found and deleted
+    return SCHEMA_INDEX_DIR / f"{_digest(identity)}-{_digest(str(fingerprint))}.json"
+
+
+def _delete_index_files(identity, keep=None):
+    for path in SCHEMA_INDEX_DIR.glob(f"{_digest(identity)}-*.json"):
+        if path != keep:
+            try:
+                path.unlink()
+            except OSError as e:
+                print(f"[Warning] Could not delete schema index {path.name}: {e}")
+
+
+def forget_schema_index(identity):
+    """Drop the in-memory and on-disk indexes of a database."""
+    with _indexes_lock:
+        for stale in [key for key in _indexes if key[0] == identity]:
+            del _indexes[stale]
+    _delete_index_files(identity)
+
+
+def get_schema_index(engine):
+    """Index for the current schema version, from memory, then disk, then built from the schema cache."""
+    tables = get_schema_details(engine)
+    fingerprint = get_cached_fingerprint(engine)
+    key = (schema_identity(engine), fingerprint)
+    with _indexes_lock:
+        index = _indexes.get(key)
+    if index is not None:
+        return index
+
+    path = _index_path(key[0], fingerprint)
+    try:
+        index = json.loads(path.read_text())
+    except (OSError, ValueError):
+        index = build_index(tables)
+        try:
+            SCHEMA_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+            path.write_text(json.dumps(index))
+        except OSError as e:
+            print(f"[Warning] Could not persist schema index: {e}")
+        # Files of older schema versions of the same database are no longer needed
+        _delete_index_files(key[0], keep=path)
+
+    with _indexes_lock:
+        # Older schema versions of the same database are no longer needed
+        for stale in [k for k in _indexes if k[0] == key[0]]:
+            del _indexes[stale]
+        _indexes[key] = index
+    return index
+
+
+on_schema_invalidated(forget_schema_index)
+
+
+def score_tables(index, question):
+    scores = {}
+    doc_count = len(index["lengths"])
+    for term in set(tokenize(question)):
+        matches = index["postings"].get(term)
+        if not matches:
+            continue
+        idf = math.log(1 + (doc_count - len(matches) + 0.5) / (len(matches) + 0.5))
+        for table, tf in matches.items():
+            norm = 1 - B + B * index["lengths"][table] / (index["avgdl"] or 1)
+            scores[table] = scores.get(table, 0.0) + idf * tf * (K1 + 1) / (tf + K1 * norm)
+    return scores
+
+
+def relevant_tables(engine, question, top_k=SCHEMA_INDEX_TOP_K):
+    """Top-k tables for the question plus their FK neighbours.
+
+    Without a matching question the best connected tables are returned, which keeps
+    schema-wide prompts (e.g. /recommend) bounded on very large databases.
+    """
+    if not SCHEMA_PRUNING:
+        return list(get_schema_details(engine))
+
+    index = get_schema_index(engine)
+    all_tables = list(index["lengths"])
+    if len(all_tables) <= top_k:
+        return all_tables
+
+    scores = score_tables(index, question or "")
+    if scores:
+        selected = sorted(scores, key=lambda table: (-scores[table], table))[:top_k]
+    else:
+        selected = sorted(all_tables, key=lambda table: (-len(index["neighbours"][table]), table))[:top_k]
+
+    # Neighbours make joins possible; higher scoring ones first, capped so hub tables cannot flood the prompt
+    limit = 2 * top_k
+    for table in list(selected):
+        neighbours = sorted(index["neighbours"][table], key=lambda name: (-scores.get(name, 0.0), name))
+        for neighbour in neighbours:
+            if len(selected) >= limit:
+                return selected
+            if neighbour not in selected:
+                selected.append(neighbour)
+    return selected
+
+
+def prune_schema(engine, question, top_k=SCHEMA_INDEX_TOP_K):
+    """{table: [columns]} restricted to the tables relevant to the question."""
+    tables = get_schema_details(engine)
+    return {table: [col["name"] for col in tables[table]["columns"]] for table in relevant_tables(engine, question, top_k)}
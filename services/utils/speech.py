@@ -0,0 +1,108 @@
+import io
+import os
+import shutil
+import subprocess
+import threading
+from fastapi import HTTPException
+from utils.metrics import stage
+
+STT_BACKEND = os.getenv("STT_BACKEND", "groq")
+STT_MODEL = os.getenv("STT_MODEL", "whisper-large-v3")
+# The hosted Whisper endpoint refuses files over 25 MB
+STT_MAX_UPLOAD_BYTES = int(os.getenv("STT_MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+STT_DOWNSAMPLE = os.getenv("STT_DOWNSAMPLE", "true").lower() == "true"
+STT_DOWNSAMPLE_MIN_BYTES = int(os.getenv("STT_DOWNSAMPLE_MIN_BYTES", str(256 * 1024)))
+# Transcriptions running at once across all callers; each holds a thread for the whole upload
+STT_CONCURRENCY = int(os.getenv("STT_CONCURRENCY", "8"))
+FASTER_WHISPER_MODEL = os.getenv("FASTER_WHISPER_MODEL", "small")
+FASTER_WHISPER_COMPUTE_TYPE = os.getenv("FASTER_WHISPER_COMPUTE_TYPE", "int8")
+
+# Multipart boundaries and form fields around the file in a request body
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+_ffmpeg = shutil.which("ffmpeg")
+_whisper_model = None
+_whisper_lock = threading.Lock()
+
+
+def upload_size(audio):
+    """Size of a seekable upload without reading it."""
+    position = audio.tell()
+    audio.seek(0, os.SEEK_END)
+    size = audio.tell()
+    audio.seek(position)
+    return size
+
+
+def check_upload_size(size, slack=0):
+    """413 for uploads over the limit; slack allows for multipart framing when checking a request's Content-Length."""
+    if size is not None and size - slack > STT_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Audio file is larger than {STT_MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+
+
+def downsample(audio, filename):
+    """Re-encode to 16 kHz mono FLAC, which is what Whisper works at anyway.
+
+    Returns (audio, filename); the original is kept when ffmpeg is missing, fails, or would not make it smaller.
+    """
+    size = upload_size(audio)
+    if not STT_DOWNSAMPLE or _ffmpeg is None or size < STT_DOWNSAMPLE_MIN_BYTES:
+        return audio, filename
+
+    with stage("stt_downsample"):
+        audio.seek(0)
+        process = subprocess.run(
+            [_ffmpeg, "-hide_banner", "-loglevel", "error", "-i", "pipe:0", "-ac", "1", "-ar", "16000", "-f", "flac", "pipe:1"],
+            input=audio.read(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=120,
+        )
+    audio.seek(0)
+    if process.returncode != 0:
+        print(f"[Warning] ffmpeg could not re-encode {filename}: {process.stderr.decode(errors='replace').strip()}")
+        return audio, filename
+    if len(process.stdout) >= size:
+        return audio, filename
+    return process.stdout, f"{os.path.splitext(filename)[0]}.flac"
+
+
+def _transcribe_groq(client, audio, filename, language):
+    transcription = client.audio.transcriptions.create(
+        file=(filename, audio),
+        model=STT_MODEL,
+        response_format="verbose_json",
+        language=language
+    )
+    return {"text": transcription.text, "language": getattr(transcription, "language", None)}
+
+
+def _get_whisper_model():
+    global _whisper_model
+    with _whisper_lock:
+        if _whisper_model is None:
+            from faster_whisper import WhisperModel
+            _whisper_model = WhisperModel(FASTER_WHISPER_MODEL, device="cpu", compute_type=FASTER_WHISPER_COMPUTE_TYPE)
+        return _whisper_model
+
+
+def _transcribe_faster_whisper(client, audio, filename, language):
+    # Runs on the CPU with no network access, for offline use and tests
+    if isinstance(audio, bytes):
+        audio = io.BytesIO(audio)
+    segments, info = _get_whisper_model().transcribe(audio, language=language or None)
+    return {"text": " ".join(segment.text.strip() for segment in segments), "language": info.language}
+
+
+# faster-whisper is an optional dependency, only imported when that backend is selected
+TRANSCRIBERS = {"groq": _transcribe_groq, "faster-whisper": _transcribe_faster_whisper}
+
+
+def transcribe(client, audio, filename, language):
+    """Transcribe a seekable binary upload with the configured backend; blocking."""
+    if STT_BACKEND not in TRANSCRIBERS:
+        raise HTTPException(status_code=500, detail=f"Unknown STT_BACKEND: {STT_BACKEND}. Choose one of {', '.join(TRANSCRIBERS)}.")
+
+    check_upload_size(upload_size(audio))
+    filename = os.path.basename(filename or "") or "audio.webm"
+    audio.seek(0)
+    audio, filename = downsample(audio, filename)
+    with stage("transcribe"):
+        return TRANSCRIBERS[STT_BACKEND](client, audio, filename, language)
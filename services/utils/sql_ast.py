@@ -0,0 +1,171 @@
+import re
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+# SQLAlchemy dialect name -> sqlglot dialect
+SQLGLOT_DIALECTS = {"postgresql": "postgres", "mysql": "mysql", "sqlite": "sqlite", "duckdb": "duckdb"}
+
+# Anything that writes, locks or runs an unparsed command is refused even inside a SELECT
+_FORBIDDEN = (
+    exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.Alter,
+    exp.TruncateTable, exp.Command, exp.Into, exp.Lock, exp.Set, exp.Use,
+)
+# Functions that read files or URLs, open other databases or load code
+_FILE_FUNCTIONS = {
+    "glob", "query", "query_table", "sniff_csv", "load_extension", "load_file", "readfile", "writefile",
+    "pg_read_file", "pg_read_binary_file", "pg_ls_dir", "pg_stat_file", "lo_import", "lo_export", "dblink", "dblink_exec",
+    "parquet_metadata", "parquet_schema", "parquet_file_metadata", "parquet_kv_metadata",
+}
+_FILE_FUNCTION_PREFIXES = ("read_",)
+# parquet_scan, sqlite_scan, postgres_scan, iceberg_scan, ...
+_FILE_FUNCTION_SUFFIXES = ("_scan",)
+_SYSTEM_SCHEMAS = {"information_schema", "pg_catalog", "mysql", "sys", "performance_schema", "sqlite_master"}
+
+_FENCED_RE = re.compile(r"```(?:sql)?\s*(.*?)\s*```", re.DOTALL | re.IGNORECASE)
+_INLINE_RE = re.compile(r"`([^`]+)`")
+_QUERY_START_RE = re.compile(r"\b(SELECT|WITH)\b", re.IGNORECASE)
+
+
+class InvalidSQL(ValueError):
+    pass
+
+
+def _sqlglot_dialect(dialect):
+    return SQLGLOT_DIALECTS.get(dialect, dialect)
+
+
+def parse_query(sql_query, dialect=None):
+    """Parse exactly one read-only query (SELECT, set operation or WITH ... SELECT); raises InvalidSQL."""
+    try:
+        statements = [statement for statement in sqlglot.parse(sql_query, read=_sqlglot_dialect(dialect)) if statement is not None]
+    except SqlglotError as e:
+        raise InvalidSQL(f"Could not parse SQL: {e}") from e
+
+    if len(statements) != 1:
+        raise InvalidSQL(f"Expected exactly one SQL statement, got {len(statements)}")
+    tree = statements[0]
+    if not isinstance(tree, exp.Query):
+        raise InvalidSQL(f"Only SELECT queries are allowed, got {tree.key.upper()}")
+    forbidden = tree.find(*_FORBIDDEN)
+    if forbidden is not None:
+        raise InvalidSQL(f"{forbidden.key.upper()} is not allowed in a read-only query")
+    for function in tree.find_all(exp.Func):
+        name = (function.name if isinstance(function, exp.Anonymous) else function.sql_name()).lower()
+        if name in _FILE_FUNCTIONS or name.startswith(_FILE_FUNCTION_PREFIXES) or name.endswith(_FILE_FUNCTION_SUFFIXES):
+            raise InvalidSQL(f"{name} is not allowed: queries may only read the database's own tables")
+    for table in tree.find_all(exp.Table):
+        # DuckDB reads FROM '/path/file.csv' or FROM 's3://...' as a file
+        if any(marker in table.name for marker in "/\\:"):
+            raise InvalidSQL(f"{table.name} is not allowed: queries may only read the database's own tables")
+    return tree
+
+
+def check_schema(tree, schema):
+    """Verify tables and columns against {table: [columns]}; raises InvalidSQL naming the first unknown one."""
+    known = {table.lower(): {column.lower() for column in columns} for table, columns in schema.items()}
+    derived = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+    derived |= {subquery.alias.lower() for subquery in tree.find_all(exp.Subquery) if subquery.alias}
+
+    # alias or name -> real table
+    sources = {}
+    opaque = bool(derived)
+    for table in tree.find_all(exp.Table):
+        name = table.name.lower()
+        if name in derived:
+            continue
+        if not name or not isinstance(table.this, exp.Identifier) or table.db.lower() in _SYSTEM_SCHEMAS or name in _SYSTEM_SCHEMAS:
+            # Table functions and catalog views have columns we do not know about
+            opaque = True
+            continue
+        if name not in known:
+            raise InvalidSQL(f"Unknown table: {table.name}")
+        sources[table.alias_or_name.lower()] = name
+
+    output_aliases = {alias.alias.lower() for alias in tree.find_all(exp.Alias)}
+    referenced_columns = set().union(*(known[name] for name in sources.values())) if sources else set()
+    for column in tree.find_all(exp.Column):
+        name = column.name.lower()
+        if not name or name == "*":
+            continue
+        qualifier = column.table.lower()
+        if qualifier:
+            table = sources.get(qualifier)
+            if table is not None and name not in known[table]:
+                raise InvalidSQL(f"Unknown column: {column.table}.{column.name}")
+        elif not opaque and name not in referenced_columns and name not in output_aliases:
+            # Unqualified names may come from derived tables or table functions, so only checked without them
+            raise InvalidSQL(f"Unknown column: {column.name}")
+
+
+def transpile_sql(sql_query, source, target):
+    """Rewrite a query from one dialect to another (e.g. MySQL backticks and LIMIT a, b for PostgreSQL)."""
+    try:
+        return sqlglot.transpile(sql_query, read=_sqlglot_dialect(source), write=_sqlglot_dialect(target))[0]
+    except SqlglotError as e:
+        raise InvalidSQL(f"Could not translate SQL from {source} to {target}: {e}") from e
+
+
+def validate_sql(sql_query, dialect, schema=None):
+    """Return the query to run on `dialect`, or raise InvalidSQL.
+
+    A query that only parses in another supported dialect is transpiled, since the model regularly mixes
+    MySQL and PostgreSQL syntax. The parsers also accept some foreign syntax (ILIKE or :: casts on MySQL),
+    so the query is always rendered back in `dialect`. The schema check is skipped when schema is None.
+    """
+    sql_query = sql_query.strip().rstrip(";").strip()
+    try:
+        tree = parse_query(sql_query, dialect)
+    except InvalidSQL as error:
+        tree = None
+        for other in SQLGLOT_DIALECTS:
+            if other == dialect:
+                continue
+            try:
+                parse_query(sql_query, other)
+            except InvalidSQL:
+                continue
+            sql_query = transpile_sql(sql_query, other, dialect)
+            tree = parse_query(sql_query, dialect)
+            break
+        if tree is None:
+            raise error
+
+    if schema is not None:
+        check_schema(tree, schema)
+    return tree.sql(dialect=_sqlglot_dialect(dialect))
+
+
+def _candidates(agent_response):
+    yield from _FENCED_RE.findall(agent_response)
+    yield from _INLINE_RE.findall(agent_response)
+    match = _QUERY_START_RE.search(agent_response)
+    if match:
+        text = agent_response[match.start():]
+        yield text
+        # Drop trailing prose after the statement
+        yield text.split(";", 1)[0]
+        yield re.split(r"\n\s*\n", text, 1)[0]
+
+
+def extract_sql_query(agent_response, dialect=None):
+    """First fenced, inline or bare query in the agent's answer that parses as a single read-only query.
+
+    The result is already translated to `dialect` if needed.
+    """
+    error = None
+    for candidate in _candidates(agent_response):
+        try:
+            return validate_sql(candidate, dialect)
+        except InvalidSQL as e:
+            error = error or e
+    raise InvalidSQL(f"Could not identify a SQL query in agent response: {agent_response!r}" + (f" ({error})" if error else ""))
+
+
+def has_limit(sql_query, dialect=None):
+    """True when the outermost query already has a LIMIT (or FETCH FIRST)."""
+    try:
+        tree = parse_query(sql_query, dialect)
+    except InvalidSQL:
+        return False
+    return tree.args.get("limit") is not None or tree.args.get("fetch") is not None
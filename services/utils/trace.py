@@ -0,0 +1,137 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+from utils.metrics import record_llm_call
+
+TRACE_MAX_STEPS = int(os.getenv("TRACE_MAX_STEPS", "200"))
+TRACE_MAX_FIELD_CHARS = int(os.getenv("TRACE_MAX_FIELD_CHARS", "4000"))
+
+# The collector of the request being served in the current context, if any.
+# Registered with LangChain so every chain/LLM run in that context reports to it without
+# passing callbacks around, and concurrent requests never see each other's steps.
+_current_trace = contextvars.ContextVar("voxalize_trace", default=None)
+register_configure_hook(_current_trace, inheritable=True)
+
+
+def _clip(value):
+    value = value if isinstance(value, str) else str(value)
+    if len(value) > TRACE_MAX_FIELD_CHARS:
+        return value[:TRACE_MAX_FIELD_CHARS] + "…(truncated)"
+    return value
+
+
+def _token_usage(response):
+    llm_output = response.llm_output or {}
+    usage = llm_output.get("token_usage") or {}
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    completion_tokens = usage.get("completion_tokens", 0)
+    if not usage:
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                prompt_tokens += metadata.get("input_tokens", 0)
+                completion_tokens += metadata.get("output_tokens", 0)
+    return llm_output.get("model_name"), prompt_tokens, completion_tokens
+
+
+class TraceCollector(BaseCallbackHandler):
+    """Structured, size-capped record of the LLM calls and agent steps made for one request."""
+
+    def __init__(self, on_event=None, max_steps=TRACE_MAX_STEPS):
+        self.on_event = on_event
+        self.max_steps = max_steps
+        self.steps = []
+        self.dropped_steps = 0
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def _add(self, step):
+        with self._lock:
+            if len(self.steps) >= self.max_steps:
+                self.dropped_steps += 1
+                return
+            self.steps.append(step)
+
+    def _elapsed(self, run_id):
+        with self._lock:
+            started = self._started.pop(run_id, None)
+        return round(time.perf_counter() - started, 4) if started is not None else None
+
+    def _start(self, run_id):
+        with self._lock:
+            self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        model, prompt_tokens, completion_tokens = _token_usage(response)
+        duration = self._elapsed(run_id)
+        record_llm_call(model, prompt_tokens, completion_tokens, duration)
+        self._add({
+            "type": "llm",
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "duration": duration,
+        })
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._add({"type": "llm", "error": _clip(error), "duration": self._elapsed(run_id)})
+
+    def on_agent_action(self, action, *, run_id, **kwargs):
+        step = {"type": "action", "tool": action.tool, "input": _clip(action.tool_input), "log": _clip(action.log)}
+        self._add(step)
+        if self.on_event is not None:
+            self.on_event("thought", {"tool": action.tool, "tool_input": step["input"], "log": step["log"]})
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        observation = _clip(output)
+        self._add({"type": "observation", "output": observation, "duration": self._elapsed(run_id)})
+        if self.on_event is not None:
+            self.on_event("observation", {"output": observation})
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._add({"type": "observation", "error": _clip(error), "duration": self._elapsed(run_id)})
+
+    def on_agent_finish(self, finish, *, run_id, **kwargs):
+        self._add({"type": "finish", "log": _clip(finish.log)})
+
+    def agent_transcript(self):
+        """Thought/Action/Observation text in the shape of the agent's verbose output."""
+        with self._lock:
+            steps = list(self.steps)
+        lines = []
+        for step in steps:
+            if step["type"] == "action":
+                lines.append(step["log"].strip())
+            elif step["type"] == "observation":
+                lines.append(f"Observation: {step.get('output', step.get('error'))}")
+            elif step["type"] == "finish":
+                lines.append(step["log"].strip())
+        return "\n".join(lines)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def trace_scope(on_event=None):
+    """Collect the trace of everything run inside the block into a fresh TraceCollector."""
+    trace = TraceCollector(on_event)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
@@ -0,0 +1,101 @@
+import hashlib
+import os
+import re
+from fastapi import HTTPException
+from utils.cache import make_cache
+from utils.executor import run_on_resource
+from utils.metrics import record_cache, stage
+
+TRANSLATE_BACKEND = os.getenv("TRANSLATE_BACKEND", "google")
+TRANSLATE_CACHE_SIZE = int(os.getenv("TRANSLATE_CACHE_SIZE", "10000"))
+TRANSLATE_CACHE_TTL = int(os.getenv("TRANSLATE_CACHE_TTL", str(7 * 24 * 3600)))
+# Source language assumed by the offline backend when the caller sends "auto"
+TRANSLATE_DEFAULT_SOURCE = os.getenv("TRANSLATE_DEFAULT_SOURCE", "")
+# Offline translations running at once; the models are CPU-bound
+TRANSLATE_CONCURRENCY = int(os.getenv("TRANSLATE_CONCURRENCY", "4"))
+
+_translations = make_cache("translations", max_entries=TRANSLATE_CACHE_SIZE, ttl=TRANSLATE_CACHE_TTL)
+_google_translator = None
+
+# Frequent English function words; questions to the database nearly always contain a few
+_ENGLISH_WORDS = {
+    "the", "a", "an", "of", "in", "on", "for", "to", "by", "with", "and", "or", "is", "are", "was", "were",
+    "what", "which", "who", "how", "many", "much", "show", "list", "give", "me", "all", "top", "most",
+    "each", "per", "from", "than", "between", "average", "total", "number", "count", "highest", "lowest",
+}
+
+
+def looks_english(text):
+    """Cheap local check so English input never costs a translation round-trip."""
+    if not text.isascii():
+        return False
+    words = re.findall(r"[a-z']+", text.lower())
+    if not words:
+        return True
+    return sum(word in _ENGLISH_WORDS for word in words) / len(words) >= 0.25
+
+
+def _cache_key(text, src, dest):
+    return hashlib.sha256(f"{src}\0{dest}\0{text}".encode("utf-8")).hexdigest()
+
+
+async def _translate_google(texts, src, dest):
+    global _google_translator
+    if _google_translator is None:
+        from googletrans import Translator
+        _google_translator = Translator()
+    results = await _google_translator.translate(texts, src=src, dest=dest)
+    return [{"text": result.text, "src": result.src} for result in results]
+
+
+def _argos_translate(texts, src, dest):
+    import argostranslate.translate
+    if src == "auto":
+        if not TRANSLATE_DEFAULT_SOURCE:
+            raise HTTPException(status_code=400, detail="The offline translator needs a source language; set src or TRANSLATE_DEFAULT_SOURCE")
+        src = TRANSLATE_DEFAULT_SOURCE
+    return [{"text": argostranslate.translate.translate(text, src, dest), "src": src} for text in texts]
+
+
+async def _translate_argos(texts, src, dest):
+    # CTranslate2 models on the CPU: no network round-trip, and safe to load-test locally
+    return await run_on_resource("translate", TRANSLATE_CONCURRENCY, _argos_translate, texts, src, dest)
+
+
+TRANSLATORS = {"google": _translate_google, "argos": _translate_argos}
+
+
+async def translate_texts(texts, src="auto", dest="en"):
+    """Translate many strings at once; returns [{"text", "src"}] in input order.
+
+    English input bound for English is returned as is, and repeated (text, src, dest) triples come from the cache.
+    """
+    if TRANSLATE_BACKEND not in TRANSLATORS:
+        raise HTTPException(status_code=500, detail=f"Unknown TRANSLATE_BACKEND: {TRANSLATE_BACKEND}. Choose one of {', '.join(TRANSLATORS)}.")
+
+    results = [None] * len(texts)
+    pending = {}
+    for position, text in enumerate(texts):
+        if not text.strip() or (dest == "en" and src in ("auto", "en") and looks_english(text)):
+            results[position] = {"text": text, "src": "en" if text.strip() else src}
+            continue
+        cached = _translations.get(_cache_key(text, src, dest))
+        record_cache("translation", cached is not None)
+        if cached is not None:
+            results[position] = cached
+        else:
+            pending.setdefault(text, []).append(position)
+
+    if pending:
+        missing = list(pending)
+        with stage("translate"):
+            translated = await TRANSLATORS[TRANSLATE_BACKEND](missing, src, dest)
+        for text, result in zip(missing, translated):
+            _translations.set(_cache_key(text, src, dest), result)
+            for position in pending[text]:
+                results[position] = result
+    return results
+
+
+async def translate_text(text, src="auto", dest="en"):
+    return (await translate_texts([text], src, dest))[0]
@@ -0,0 +1,121 @@
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from utils.metrics import record_cache, stage
+
+TTS_MODEL = os.getenv("TTS_MODEL", "playai-tts")
+TTS_CACHE_DIR = Path(os.getenv("TTS_CACHE_DIR", "speech_output"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+TTS_CHUNK_BYTES = int(os.getenv("TTS_CHUNK_BYTES", str(16 * 1024)))
+# Syntheses streaming at once; each holds a thread until all of its audio has been produced
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "16"))
+
+# Formats the backend can produce; ogg carries opus
+AUDIO_FORMATS = {"wav": "audio/wav", "mp3": "audio/mpeg", "flac": "audio/flac", "ogg": "audio/ogg"}
+
+
+class SpeechCache:
+    """Content-addressed audio files on disk, evicted least recently used first once over max_bytes."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._entries = None
+        self._total = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text, voice, audio_format, model=TTS_MODEL):
+        return hashlib.sha256(f"{model}\0{voice}\0{audio_format}\0{text}".encode("utf-8")).hexdigest()
+
+    def _load(self):
+        # Caller holds the lock; picks up files left by earlier runs, oldest first
+        if self._entries is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = sorted((path for path in self.directory.iterdir() if path.is_file() and not path.name.endswith(".part")), key=lambda path: path.stat().st_mtime)
+        self._entries = OrderedDict((path.name, path.stat().st_size) for path in files)
+        self._total = sum(self._entries.values())
+
+    def path(self, key, audio_format):
+        return self.directory / f"{key}.{audio_format}"
+
+    def get(self, key, audio_format):
+        """Path of the cached file, or None."""
+        name = f"{key}.{audio_format}"
+        with self._lock:
+            self._load()
+            hit = name in self._entries
+            if hit:
+                self._entries.move_to_end(name)
+        record_cache("tts", hit)
+        if not hit:
+            return None
+        path = self.path(key, audio_format)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._total -= self._entries.pop(name, 0)
+            return None
+        return path
+
+    def writer(self, key, audio_format):
+        """Temporary file to write into; commit() publishes it under the final name."""
+        return self.directory / f"{key}.{audio_format}.{uuid.uuid4().hex}.part"
+
+    def commit(self, part, key, audio_format):
+        final = self.path(key, audio_format)
+        os.replace(part, final)
+        size = final.stat().st_size
+        with self._lock:
+            self._load()
+            self._total += size - self._entries.pop(final.name, 0)
+            self._entries[final.name] = size
+            evicted = []
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                name, evicted_size = self._entries.popitem(last=False)
+                self._total -= evicted_size
+                evicted.append(name)
+        for name in evicted:
+            try:
+                os.remove(self.directory / name)
+            except FileNotFoundError:
+                pass
+        return final
+
+    def stats(self):
+        with self._lock:
+            self._load()
+            return {"entries": len(self._entries), "bytes": self._total, "max_bytes": self.max_bytes}
+
+
+speech_cache = SpeechCache(TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES)
+
+
+def synthesize(client, text, voice, audio_format, on_chunk):
+    """Stream speech from the backend to on_chunk(bytes) while writing it to the cache; blocking.
+
+    The file is only published once complete, so a failed or partial synthesis is never served from cache.
+    """
+    key = SpeechCache.key(text, voice, audio_format)
+    speech_cache.directory.mkdir(parents=True, exist_ok=True)
+    part = speech_cache.writer(key, audio_format)
+    try:
+        with stage("tts"), open(part, "wb") as output:
+            with client.audio.speech.with_streaming_response.create(
+                model=TTS_MODEL,
+                voice=voice,
+                response_format=audio_format,
+                input=text
+            ) as response:
+                for chunk in response.iter_bytes(TTS_CHUNK_BYTES):
+                    output.write(chunk)
+                    on_chunk(chunk)
+        return speech_cache.commit(part, key, audio_format)
+    finally:
+        if part.exists():
+            os.remove(part)